@@ -16,7 +16,7 @@ from taichi_splatting.rasterizer.function import rasterize
 from taichi_splatting.misc.parameter_class import ParameterClass
 from taichi_splatting.tests.random_data import random_2d_gaussians
 
-from taichi_splatting.torch_ops.util import check_finite
+from taichi_splatting.misc.nonfinite import count_nonfinite, check_counts
 from torch.profiler import profile, record_function, ProfilerActivity
 
 import time
@@ -27,7 +27,7 @@ def parse_args():
   parser.add_argument('--image_file', type=str)
   parser.add_argument('--seed', type=int, default=0)
   parser.add_argument('--tile_size', type=int, default=16)
-  parser.add_argument('--pixel_tile', type=str, help='Pixel tile for backward pass default "2,2"')
+  parser.add_argument('--pixel_tile', type=str, help='Pixel tile per thread for forward and backward passes default "2,2"')
 
   parser.add_argument('--n', type=int, default=1000)
   parser.add_argument('--target', type=int, default=None)
@@ -66,6 +66,7 @@ def train_epoch(opt, gaussians, ref_image, epoch_size=100, config:RasterConfig =
     h, w = ref_image.shape[:2]
 
     contrib = torch.zeros((gaussians.batch_size[0], 2), device=gaussians.position.device)
+    nonfinite = {}
 
     for i in range(epoch_size):
       opt.zero_grad()
@@ -83,7 +84,7 @@ def train_epoch(opt, gaussians, ref_image, epoch_size=100, config:RasterConfig =
       loss = torch.nn.functional.l1_loss(raster.image, ref_image) #+ (1e-4 * gaussians.log_scaling).pow(2).sum()
       loss.backward()
 
-      check_finite(gaussians, 'gaussians', warn=True)
+      count_nonfinite(dict(gaussians.items()), 'gaussians', nonfinite, zero_nonfinite=True)
       opt.step()
 
       with torch.no_grad():
@@ -94,6 +95,9 @@ def train_epoch(opt, gaussians, ref_image, epoch_size=100, config:RasterConfig =
 
 
       visibility, gradient = contrib.unbind(dim=1)
+
+    # read the counts once per epoch (avoids a host sync every iteration)
+    check_counts(nonfinite, warn=True)
     return raster.image, visibility, gradient 
 
 
@@ -20,6 +20,7 @@ def parse_args(args=None):
   parser.add_argument('--n', type=int, default=1000000)
   parser.add_argument('--scale_factor', type=float, default=2)
   parser.add_argument('--tile_size', type=int, default=16)
+  parser.add_argument('--macro_tile_size', type=int, default=None)
 
   parser.add_argument('--seed', type=int, default=0)
   parser.add_argument('--iters', type=int, default=1000)
@@ -42,7 +43,8 @@ def bench_rasterizer(args):
   depth_range = (0.1, 100.)
   gaussians = random_2d_gaussians(args.n, args.image_size, 
           args.scale_factor, alpha_range=(0.5, 1.0), depth_range=depth_range).to(args.device)
-  config = RasterConfig(tile_size=args.tile_size, tight_culling=not args.no_tight_culling)
+  config = RasterConfig(tile_size=args.tile_size, macro_tile_size=args.macro_tile_size, 
+                        tight_culling=not args.no_tight_culling)
   
   gaussians2d = project_gaussians2d(gaussians)
 
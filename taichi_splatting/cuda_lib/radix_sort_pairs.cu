@@ -1,5 +1,6 @@
 #include <torch/extension.h>
 #include <ATen/cuda/CUDAContext.h>
+#include <c10/cuda/CUDAGuard.h>
 
 #include <cub/cub.cuh>
 
@@ -8,7 +9,7 @@ template <typename K, typename V>
 void sort_helper(
   K *d_keys, V *d_values, 
   K *d_keys_out, V *d_values_out,
-  int num_items,
+  int num_items, const torch::TensorOptions &options,
   int begin_bit=0, int end_bit=-1) 
 {
   size_t   temp_storage_bytes = 0;
@@ -18,14 +19,11 @@ void sort_helper(
   cub::DeviceRadixSort::SortPairs(nullptr, temp_storage_bytes,
       d_keys, d_keys_out, d_values, d_values_out, num_items, begin_bit, end_bit, stream);
 
-  auto temp_storage = torch::empty({int64_t(temp_storage_bytes)}, 
-    torch::TensorOptions().dtype(torch::kUInt8).device(torch::kCUDA));
+  // temporary storage on the same device as the keys (not the default device)
+  auto temp_storage = torch::empty({int64_t(temp_storage_bytes)}, options.dtype(torch::kUInt8));
 
   cub::DeviceRadixSort::SortPairs(temp_storage.data_ptr<uint8_t>(), temp_storage_bytes,
       d_keys, d_keys_out, d_values, d_values_out, num_items, begin_bit, end_bit, stream);
-
-  cudaDeviceSynchronize();
-
 }
 
 std::pair<torch::Tensor, torch::Tensor> radix_sort_pairs(
@@ -34,6 +32,9 @@ std::pair<torch::Tensor, torch::Tensor> radix_sort_pairs(
   assert (keys.dim() == 1 && values.dim() == 1), "keys and values must be 1D";
   assert (keys.size(0) == values.size(0)), "keys and values must have the same size";
   
+  // sort on the device (and current stream) of the inputs
+  const at::cuda::OptionalCUDAGuard device_guard(keys.device());
+
   auto keys_out = torch::empty_like(keys);
   auto values_out = torch::empty_like(values);
 
@@ -43,7 +44,7 @@ std::pair<torch::Tensor, torch::Tensor> radix_sort_pairs(
     sort_helper<uint32_t, int32_t>(
       (uint32_t*)keys.data_ptr<int32_t>(), values.data_ptr<int32_t>(), 
       (uint32_t*)keys_out.data_ptr<int32_t>(), values_out.data_ptr<int32_t>(),
-      keys.size(0), begin_bit, end_bit);
+      keys.size(0), keys.options(), begin_bit, end_bit);
 
       return std::make_pair(keys_out, values_out);
 
@@ -51,7 +52,7 @@ std::pair<torch::Tensor, torch::Tensor> radix_sort_pairs(
     sort_helper<int32_t, int32_t>(
       keys.data_ptr<int32_t>(), values.data_ptr<int32_t>(), 
       keys_out.data_ptr<int32_t>(), values_out.data_ptr<int32_t>(),
-      keys.size(0), begin_bit, end_bit);
+      keys.size(0), keys.options(), begin_bit, end_bit);
 
       return std::make_pair(keys_out, values_out);
 
@@ -59,7 +60,7 @@ std::pair<torch::Tensor, torch::Tensor> radix_sort_pairs(
     sort_helper<int64_t, int32_t>(
       keys.data_ptr<int64_t>(), values.data_ptr<int32_t>(), 
       keys_out.data_ptr<int64_t>(), values_out.data_ptr<int32_t>(),
-      keys.size(0), begin_bit, end_bit);
+      keys.size(0), keys.options(), begin_bit, end_bit);
 
       return std::make_pair(keys_out, values_out);
 
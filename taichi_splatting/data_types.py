@@ -1,5 +1,5 @@
 from dataclasses import dataclass, replace
-from beartype.typing import Tuple
+from beartype.typing import Optional, Tuple
 from beartype import beartype
 from tensordict import tensorclass
 import torch
@@ -10,7 +10,7 @@ import torch
 class RasterConfig:
   tile_size: int = 16
 
-  # pixel tilin per thread in the backwards pass 
+  # pixel tiling per thread in the forward and backward passes
   pixel_stride: Tuple[int, int] = (2, 2)
 
   margin_tiles: int = 3
@@ -18,13 +18,32 @@ class RasterConfig:
   # cutoff N standard deviations from mean
   gaussian_scale: float = 3.0   
   
-  # cull to an oriented box, otherwise an axis aligned bounding box
+  # cull to tiles intersecting the ellipse, otherwise an axis aligned bounding box
   tight_culling: bool = True  
 
   clamp_max_alpha: float = 0.99
   alpha_threshold: float = 1. / 255.
   saturate_threshold: float = 0.9999
 
+  # store point features at half precision in shared memory (faster, less precise)
+  use_fp16_features: bool = False
+
+  # store gaussian conic and alpha at half precision in shared memory (faster, less precise)
+  use_fp16_conic: bool = False
+
+  # tile size used to map gaussians to tiles, a multiple of tile_size (default tile_size)
+  # larger macro tiles give fewer overlaps to sort, but more gaussians for each tile to render 
+  macro_tile_size: Optional[int] = None
+
+  def __post_init__(self):
+    assert self.macro_tile_size is None or self.macro_tile_size % self.tile_size == 0, \
+      f"macro_tile_size {self.macro_tile_size} must be a multiple of tile_size {self.tile_size}"
+
+  @property
+  def map_tile_size(self) -> int:
+    """ tile size used to map gaussians to tiles (macro_tile_size if set, otherwise tile_size) """
+    return self.macro_tile_size or self.tile_size
+
 
 
 def check_packed3d(packed_gaussians: torch.Tensor):
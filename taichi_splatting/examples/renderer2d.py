@@ -10,29 +10,11 @@ import torch.nn.functional as F
 from taichi_splatting.data_types import Gaussians2D
 from taichi_splatting.misc.encode_depth import encode_depth32
 
+from taichi_splatting.misc.projection2d import project_gaussians2d
 from taichi_splatting.rasterizer import rasterize, RasterConfig
 from taichi_splatting.rasterizer.function import RasterOut
 
 
-def project_gaussians2d(points: Gaussians2D) -> torch.Tensor:
-    """
-    Torch based "projection" of 2D Gaussian parameters to the packed conic-based
-    representation used by the tile-mapper and rasterizer.
-    Args:
-        points: The Gaussians2D parameters to be "projected".
-    Returns:
-        torch.Tensor [N, 6] the packed
-        conic-based representation of the Gaussians2D object.
-         
-    """
-    alpha = torch.sigmoid(points.alpha_logit)
-    inv_cov = torch.inverse(point_covariance(points))
-
-    conic = torch.stack([inv_cov[..., 0, 0], inv_cov[..., 0, 1], inv_cov[..., 1, 1]], dim=-1)
-    return torch.cat([points.position, conic, alpha.unsqueeze(1)], dim=-1)  
-    
-
-
 def point_basis(points:Gaussians2D):
   scale = torch.exp(points.log_scaling)
 
@@ -50,10 +32,6 @@ def point_rotation(points:Gaussians2D):
 
   return torch.stack([v1, v2], dim=2) 
 
-def point_covariance(gaussians):
-  basis = point_basis(gaussians)
-  return torch.bmm(basis.transpose(1, 2), basis)
-
 
 def split_by_samples(points: Gaussians2D, samples: torch.Tensor, depth_noise:float=1e-2) -> Gaussians2D:
   num_points, n, _ = samples.shape
@@ -13,6 +13,7 @@ from taichi_splatting.taichi_lib.concurrent import add, block_reduce_i32, warp_a
 from taichi_splatting.taichi_lib.f32 import (Gaussian2D)
 from taichi_splatting.taichi_lib.grid_query import make_grid_query
 from taichi_splatting.taichi_lib.conversions import torch_taichi
+from taichi_splatting.mapper.tile_mapper import sort_bits
 
 def pad_to_tile(image_size: Tuple[Integral, Integral], tile_size: int):
   def pad(x):
@@ -27,7 +28,7 @@ def tile_mapper(config:RasterConfig, depth_type=torch.int32):
   if depth_type == torch.int32:
     max_tile = 65535
     key_type = torch.int64
-    end_sort_bit = 48
+    depth_bits = 32
 
     @ti.func
     def make_sort_key(depth:ti.i32, tile_id:ti.i32) -> ti.i64:
@@ -41,7 +42,7 @@ def tile_mapper(config:RasterConfig, depth_type=torch.int32):
   elif depth_type == torch.int16:
     max_tile = 65535
     key_type = torch.int32
-    end_sort_bit = 32
+    depth_bits = 16
 
     @ti.func
     def make_sort_key(depth:ti.i16, tile_id:ti.i32):
@@ -58,10 +59,12 @@ def tile_mapper(config:RasterConfig, depth_type=torch.int32):
   else:
     raise ValueError(f"depth_type {depth_type} not supported")
   
-  tile_size = config.tile_size
+  # gaussians are mapped to (macro) tiles, which may contain several raster tiles
+  tile_size = config.map_tile_size
   grid_ops = make_grid_query(
     tile_size=tile_size, 
     gaussian_scale=config.gaussian_scale, 
+    alpha_threshold=config.alpha_threshold,
     tight_culling=config.tight_culling)
   
   grid_query = grid_ops.grid_query
@@ -148,7 +151,7 @@ def tile_mapper(config:RasterConfig, depth_type=torch.int32):
 
     return total_overlaps
 
-  def sort_cull_tiles(depths:torch.Tensor, gaussians:torch.Tensor, max_overlaps:int, image_size):
+  def sort_cull_tiles(depths:torch.Tensor, gaussians:torch.Tensor, max_overlaps:int, image_size, end_bit:int):
 
     overlap_key = torch.empty((max_overlaps, ), dtype=key_type, device=gaussians.device)
     overlap_to_point = torch.empty((max_overlaps, ), dtype=torch.int32, device=gaussians.device)
@@ -158,7 +161,7 @@ def tile_mapper(config:RasterConfig, depth_type=torch.int32):
     
 
     return cuda_lib.radix_sort_pairs(
-       overlap_key[:total_overlaps], overlap_to_point[:total_overlaps], end_bit=end_sort_bit)
+       overlap_key[:total_overlaps], overlap_to_point[:total_overlaps], end_bit=end_bit)
   
 
 
@@ -170,6 +173,8 @@ def tile_mapper(config:RasterConfig, depth_type=torch.int32):
     assert tile_shape[0] * tile_shape[1] < max_tile, \
       f"tile dimensions {tile_shape} for image size {image_size} exceed maximum tile count (16 bit id), try increasing tile_size" 
 
+    end_bit = depth_bits + sort_bits(tile_shape[0] * tile_shape[1])
+
     with torch.no_grad():
       max_overlaps = tile_overlaps_kernel(gaussians, ivec2(image_size))
 
@@ -179,7 +184,7 @@ def tile_mapper(config:RasterConfig, depth_type=torch.int32):
 
       if max_overlaps > 0:
         overlap_key, overlap_to_point = sort_cull_tiles(
-          depths, gaussians, max_overlaps, image_size)
+          depths, gaussians, max_overlaps, image_size, end_bit)
         
         if overlap_key.shape[0] > 0:
           find_ranges_kernel(overlap_key, tile_ranges.view(-1, 2))
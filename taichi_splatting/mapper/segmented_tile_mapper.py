@@ -26,10 +26,12 @@ def tile_mapper(config:RasterConfig, depth_type):
 
   ti_depth_type = torch_taichi[depth_type]
 
-  tile_size = config.tile_size
+  # gaussians are mapped to (macro) tiles, which may contain several raster tiles
+  tile_size = config.map_tile_size
   grid_ops = make_grid_query(
     tile_size=tile_size, 
     gaussian_scale=config.gaussian_scale, 
+    alpha_threshold=config.alpha_threshold,
     tight_culling=config.tight_culling)
   
   grid_query = grid_ops.grid_query
@@ -1,4 +1,5 @@
 from functools import cache
+from types import SimpleNamespace
 import math
 from numbers import Integral
 from beartype.typing import Tuple
@@ -8,6 +9,7 @@ from taichi.math import ivec2
 import torch
 from taichi_splatting import cuda_lib
 from taichi_splatting.data_types import RasterConfig
+from taichi_splatting.taichi_lib.concurrent import block_exclusive_scan_i32
 
 from taichi_splatting.taichi_lib.f32 import (Gaussian2D)
 from taichi_splatting.taichi_lib.conversions import torch_taichi
@@ -21,102 +23,143 @@ def pad_to_tile(image_size: Tuple[Integral, Integral], tile_size: int):
   return tuple(pad(x) for x in image_size)
 
 
+def sort_bits(num_tiles:int) -> int:
+  """ number of bits required to represent a tile id (0..num_tiles] """
+  return max(num_tiles - 1, 0).bit_length()
+
+
+@ti.func
+def get_tile_id(key:ti.i32, tile_shift:ti.i32) -> ti.i32:
+  # tile id is in the high bits of the (32 bit) key
+  key_u32 = ti.bit_cast(key, ti.u32)
+  return ti.cast(key_u32 >> ti.cast(tile_shift, ti.u32), ti.i32)
+
+
+@ti.kernel
+def find_ranges_kernel(
+    sorted_keys: ti.types.ndarray(ti.i32, ndim=1),  # (M)
+    # output tile_ranges (tile id -> start, end)
+    tile_ranges: ti.types.ndarray(ti.math.ivec2, ndim=1),   
+    tile_shift: ti.i32,
+):  
+  # clear all tiles in parallel (tiles with no overlaps keep an empty range),
+  # top level loops run in order so this completes before the ranges are written
+  for tile_id in range(tile_ranges.shape[0]):
+    tile_ranges[tile_id] = ti.math.ivec2(0, 0)
+
+  num_keys = sorted_keys.shape[0]
+
+  ti.loop_config(block_dim=1024)
+  for idx in range(num_keys):
+      tile_id = get_tile_id(sorted_keys[idx], tile_shift)
+
+      prev_tile_id = -1
+      if idx > 0:
+        prev_tile_id = get_tile_id(sorted_keys[idx - 1], tile_shift)
+
+      next_tile_id = -1
+      if idx + 1 < num_keys:
+        next_tile_id = get_tile_id(sorted_keys[idx + 1], tile_shift)
+
+      # first and last key of each tile write the start and end of the range
+      if tile_id != prev_tile_id:
+        tile_ranges[tile_id][0] = idx
+
+      if tile_id != next_tile_id:
+        tile_ranges[tile_id][1] = idx + 1
+
+
 @cache
 def tile_mapper(config:RasterConfig, depth_type=torch.int32):
 
+  max_tile = 65535
+  key_type = torch.int32
+
   if depth_type == torch.int32:
-    max_tile = 65535
-    key_type = torch.int64
-    end_sort_bit = 48
+    # encoded depth is a positive float bit pattern, so the sign bit is always zero
+    depth_bits = 31
 
     @ti.func
-    def make_sort_key(depth, tile_id):
+    def encode_depth(depth:ti.i32) -> ti.u32:
         assert depth >= 0, f"depth {depth} cannot be negative for int 32 key!"
-
-        return ti.cast(depth, ti.i64) | (ti.cast(tile_id, ti.i64) << 32)
-  
-    @ti.func
-    def get_tile_id(key):
-      return ti.cast(key >> 32, ti.i32)
-
+        return ti.cast(depth, ti.u32)
 
   elif depth_type == torch.int16:
-    max_tile = 65535
-    key_type = torch.int32
-    end_sort_bit = 32
+    depth_bits = 16
 
     @ti.func
-    def make_sort_key(depth:ti.i16, tile_id:ti.i32):
-        depthu = ti.cast(depth, ti.i32) + 32767
-
-        key_u32 = ti.cast(depthu, ti.u32) | (ti.cast(tile_id, ti.u32) << 16)
-        return ti.bit_cast(key_u32, ti.i32)
-  
-    @ti.func
-    def get_tile_id(key:ti.i32):
-      key_u32 = ti.bit_cast(key, ti.u32)
-      return ti.cast(key_u32 >> 16, ti.i32)
+    def encode_depth(depth:ti.i16) -> ti.u32:
+        return ti.cast(ti.cast(depth, ti.i32) + 32767, ti.u32)
 
   else:
     raise ValueError(f"depth_type {depth_type} not supported")
 
 
-  tile_size = config.tile_size
+  @ti.func
+  def make_sort_key(depth, tile_id:ti.i32, tile_shift:ti.i32) -> ti.i32:
+      # 32 bit key - tile_id in the high bits, as many (most significant) bits of depth
+      # as fit in the low tile_shift bits. At the maximum tile count (16 tile bits) this leaves
+      # 16 bits of depth, for int32 depths (float bit pattern) 8 exponent + 8 mantissa bits,
+      # a relative depth resolution of 2^-8. Overlaps are generated in point order and the
+      # radix sort is stable, so depths equal to this precision are ordered by point index
+      shift = ti.cast(tile_shift, ti.u32)
+      depth_u32 = encode_depth(depth) >> (ti.cast(depth_bits, ti.u32) - shift)
+
+      key_u32 = depth_u32 | (ti.cast(tile_id, ti.u32) << shift)
+      return ti.bit_cast(key_u32, ti.i32)
+
+  # gaussians are mapped to (macro) tiles, which may contain several raster tiles
+  tile_size = config.map_tile_size
   grid_ops = make_grid_query(
     tile_size=tile_size, 
     gaussian_scale=config.gaussian_scale, 
+    alpha_threshold=config.alpha_threshold,
     tight_culling=config.tight_culling)
   
   grid_query = grid_ops.grid_query
   
 
+  overlap_block_dim = 256
+
   @ti.kernel
   def tile_overlaps_kernel(
       gaussians: ti.types.ndarray(Gaussian2D.vec, ndim=1),  
       image_size: ivec2,
 
       # outputs
-      counts: ti.types.ndarray(ti.i32, ndim=1),
+      overlap_offsets: ti.types.ndarray(ti.i32, ndim=1), # (N) offset within the block
+      block_counts: ti.types.ndarray(ti.i32, ndim=1), # (num_blocks) total overlaps of the block
   ):
-      ti.loop_config(block_dim=128)
-      for idx in range(gaussians.shape[0]):
-          query = grid_query(gaussians[idx], image_size)
-          counts[idx] =  query.count_tiles()
-
+      num_blocks = block_counts.shape[0]
 
+      # count tiles for each gaussian and scan the counts within each block in the same pass,
+      # offsets of blocks are a (deterministic) cumsum of block_counts, added in generate_sort_keys
+      ti.loop_config(block_dim=overlap_block_dim)
+      for block_id, thread_idx in ti.ndrange(num_blocks, overlap_block_dim):
+          idx = block_id * overlap_block_dim + thread_idx
 
+          count = 0
+          if idx < gaussians.shape[0]:
+            query = grid_query(gaussians[idx], image_size)
+            count = query.count_tiles()
 
+          offset, total = block_exclusive_scan_i32(count, thread_idx, overlap_block_dim)
+          if idx < gaussians.shape[0]:
+            overlap_offsets[idx] = offset
 
-  @ti.kernel
-  def find_ranges_kernel(
-      sorted_keys: ti.types.ndarray(torch_taichi[key_type], ndim=1),  # (M)
-      # output tile_ranges (tile id -> start, end)
-      tile_ranges: ti.types.ndarray(ti.math.ivec2, ndim=1),   
-  ):  
-    ti.loop_config(block_dim=1024)
-    for idx in range(sorted_keys.shape[0]):
-        # tile id is in the 32 high bits of the 64 bit key
-        tile_id = get_tile_id(sorted_keys[idx])
-        
-        next_tile_id = max_tile
-        if idx + 1 < sorted_keys.shape[0]:
-           next_tile_id = get_tile_id(sorted_keys[idx + 1])
-
-        
-        if tile_id != next_tile_id:
-            tile_ranges[tile_id][1] = idx + 1
+          if thread_idx == ti.static(overlap_block_dim - 1):
+            block_counts[block_id] = total
 
-            if next_tile_id < max_tile:
-              tile_ranges[next_tile_id][0] = idx + 1
 
 
   @ti.kernel
   def generate_sort_keys_kernel(
       depths: ti.types.ndarray(torch_taichi[depth_type], ndim=1),  # (M)
       gaussians : ti.types.ndarray(Gaussian2D.vec, ndim=1),  # (M)
-      cumulative_overlap_counts: ti.types.ndarray(ti.i32, ndim=1),  # (M)
-      # (K), K = sum(num_overlap_tiles)
+      overlap_offsets: ti.types.ndarray(ti.i32, ndim=1),  # (M)
+      block_offsets: ti.types.ndarray(ti.i32, ndim=1),  # (num_blocks + 1)
       image_size: ivec2,
+      tile_shift: ti.i32,
 
       # outputs
       overlap_sort_key: ti.types.ndarray(torch_taichi[key_type], ndim=1),
@@ -126,9 +169,9 @@ def tile_mapper(config:RasterConfig, depth_type=torch.int32):
     tiles_wide = image_size.x // tile_size
 
     ti.loop_config(block_dim=128)
-    for idx in range(cumulative_overlap_counts.shape[0]):
+    for idx in range(overlap_offsets.shape[0]):
       query = grid_query(gaussians[idx], image_size)
-      key_idx = cumulative_overlap_counts[idx]
+      key_idx = overlap_offsets[idx] + block_offsets[idx // overlap_block_dim]
       depth = depths[idx]
 
 
@@ -137,63 +180,119 @@ def tile_mapper(config:RasterConfig, depth_type=torch.int32):
           tile = tile_uv + query.min_tile
           tile_id = tile.x + tile.y * tiles_wide
       
-          key = make_sort_key(depth, tile_id)
+          key = make_sort_key(depth, tile_id, tile_shift)
 
           # sort based on tile_id, depth
-          overlap_sort_key[key_idx] = key
-          overlap_to_point[key_idx] = idx # map overlap index back to point index
+          # keys past the capacity of the buffers are dropped (and regenerated, see f)
+          if key_idx < overlap_sort_key.shape[0]:
+            overlap_sort_key[key_idx] = key
+            overlap_to_point[key_idx] = idx # map overlap index back to point index
           key_idx += 1
 
 
-  def sort_tile_depths(depths:torch.Tensor, tile_overlap_ranges:torch.Tensor, cum_overlap_counts:torch.Tensor, total_overlap:int, image_size):
+  # intermediate buffers (offsets, block counts and the unsorted keys/points, the sort writes new tensors)
+  # are kept between calls and grown geometrically to avoid reallocation every frame,
+  # tensors returned to the caller are always newly allocated
+  buffers = {}
 
-    overlap_key = torch.empty((total_overlap, ), dtype=key_type, device=cum_overlap_counts.device)
-    overlap_to_point = torch.empty((total_overlap, ), dtype=torch.int32, device=cum_overlap_counts.device)
+  def get_buffer(name:str, size:int, dtype:torch.dtype, device:torch.device):
+    buffer = buffers.get(name)
 
-    generate_sort_keys_kernel(depths.contiguous(), tile_overlap_ranges, cum_overlap_counts, image_size,
-                              overlap_key, overlap_to_point)
+    if buffer is None or buffer.device != device or buffer.shape[0] < size:
+      capacity = size if buffer is None else max(2 * buffer.shape[0], size)
+      buffer = buffers[name] = torch.empty((capacity, ), dtype=dtype, device=device)
+
+    return buffer[:size]
+
+  def buffer_capacity(name:str) -> int:
+    buffer = buffers.get(name)
+    return 0 if buffer is None else buffer.shape[0]
+
+
+  def generate_sort_keys(depths:torch.Tensor, gaussians:torch.Tensor, overlap_offsets:torch.Tensor, block_offsets:torch.Tensor, 
+                       capacity:int, image_size, tile_shift:int):
 
-    overlap_key, overlap_to_point  = cuda_lib.radix_sort_pairs(overlap_key, overlap_to_point, end_bit=end_sort_bit, unsigned=True)
+    overlap_key = get_buffer('overlap_key', capacity, key_type, overlap_offsets.device)
+    overlap_to_point = get_buffer('overlap_to_point', capacity, torch.int32, overlap_offsets.device)
+
+    generate_sort_keys_kernel(depths, gaussians, overlap_offsets, block_offsets, image_size, tile_shift,
+                              overlap_key, overlap_to_point)
     return overlap_key, overlap_to_point
   
 
   def generate_tile_overlaps(gaussians, image_size):
-    overlap_counts = torch.empty( (gaussians.shape[0], ), dtype=torch.int32, device=gaussians.device)
+    """ returns overlap_offsets (offset within each block of overlap_block_dim gaussians),
+        block_offsets (exclusive cumsum of block totals) and total_overlap (on device) """
+    num_blocks = (gaussians.shape[0] + overlap_block_dim - 1) // overlap_block_dim
+
+    # both are written entirely by tile_overlaps_kernel
+    overlap_offsets = get_buffer('overlap_offsets', gaussians.shape[0], torch.int32, gaussians.device)
+    block_counts = get_buffer('block_counts', num_blocks, torch.int32, gaussians.device)
+
+    tile_overlaps_kernel(gaussians, ivec2(image_size), overlap_offsets, block_counts)
 
-    tile_overlaps_kernel(gaussians, ivec2(image_size), overlap_counts)
+    block_offsets = get_buffer('block_offsets', num_blocks + 1, torch.int32, gaussians.device)
+    block_offsets[:1].zero_()
+    torch.cumsum(block_counts, dim=0, dtype=torch.int32, out=block_offsets[1:])
 
-    cum_overlap_counts, total_overlap = cuda_lib.full_cumsum(overlap_counts)
-    return cum_overlap_counts[:-1], total_overlap
+    return overlap_offsets, block_offsets, block_offsets[-1:]
 
   def f(gaussians : torch.Tensor, depths:torch.Tensor, image_size:Tuple[Integral, Integral]):
 
     image_size = pad_to_tile(image_size, tile_size)
     tile_shape = (image_size[1] // tile_size, image_size[0] // tile_size)
 
-    assert tile_shape[0] * tile_shape[1] < max_tile, \
+    num_tiles = tile_shape[0] * tile_shape[1]
+    assert num_tiles < max_tile, \
       f"tile dimensions {tile_shape} for image size {image_size} exceed maximum tile count (16 bit id), try increasing tile_size" 
 
+    # split the 32 bit key between tile id and depth, radix sort only over bits used
+    # (each radix pass is memory bound, so fewer bits is faster)
+    tile_bits = max(sort_bits(num_tiles), 1)
+    tile_shift = min(depth_bits, 32 - tile_bits)
+    end_bit = tile_shift + tile_bits
 
     with torch.no_grad():
-      cum_overlap_counts, total_overlap = generate_tile_overlaps(
+      depths = depths.contiguous()
+      overlap_offsets, block_offsets, total_overlap = generate_tile_overlaps(
         gaussians, image_size)
-            
 
-      # This needs to be initialised to zeros (not empty)
-      # as sometimes there are no overlaps for a tile
-      tile_ranges = torch.zeros((*tile_shape, 2), dtype=torch.int32, device=gaussians.device)
+      # keys are generated into the current capacity of the key buffers before the host sync,
+      # so the sync waits on key generation instead of leaving the GPU idle between the kernels.
+      # (the radix sort still needs the number of items on the host - CUB takes num_items 
+      # as a host argument, and sorting the full capacity with sentinel keys every frame costs 
+      # more than the sync and could silently drop overlaps when the capacity is exceeded)
+      capacity = max(buffer_capacity('overlap_key'), 4 * gaussians.shape[0])
+      overlap_key, overlap_to_point = generate_sort_keys(
+        depths, gaussians, overlap_offsets, block_offsets, capacity, image_size, tile_shift)
+
+      # the only host sync
+      total_overlap = total_overlap.item()
+      if total_overlap > capacity:
+        # buffers are grown (geometrically) and the keys regenerated
+        overlap_key, overlap_to_point = generate_sort_keys(
+          depths, gaussians, overlap_offsets, block_offsets, total_overlap, image_size, tile_shift)
+
+      # every tile is written by find_ranges_kernel (or zeroed when there are no overlaps)
+      tile_ranges = torch.empty((*tile_shape, 2), dtype=torch.int32, device=gaussians.device)
 
       if total_overlap > 0:
-        overlap_key, overlap_to_point = sort_tile_depths(
-          depths, gaussians, cum_overlap_counts, total_overlap, image_size)
+        # sort (key, point) pairs directly, restricted to the bits used by the key
+        overlap_key, overlap_to_point  = cuda_lib.radix_sort_pairs(
+          overlap_key[:total_overlap], overlap_to_point[:total_overlap], end_bit=end_bit, unsigned=True)
         
-        find_ranges_kernel(overlap_key, tile_ranges.view(-1, 2))
+        find_ranges_kernel(overlap_key, tile_ranges.view(-1, 2), tile_shift)
       else:
+        tile_ranges.zero_()
         overlap_to_point = torch.empty((0, ), dtype=torch.int32, device=gaussians.device)
 
       return overlap_to_point, tile_ranges
       
-  return f
+  return SimpleNamespace(
+    map_to_tiles=f,
+    generate_tile_overlaps=generate_tile_overlaps,
+    overlap_block_dim=overlap_block_dim
+  )
 
 
 @beartype
@@ -215,4 +314,4 @@ def map_to_tiles(gaussians : torch.Tensor, encoded_depth:torch.Tensor,
 
   
   mapper = tile_mapper(config, depth_type=encoded_depth.dtype)
-  return mapper(gaussians, encoded_depth, image_size)
\ No newline at end of file
+  return mapper.map_to_tiles(gaussians, encoded_depth, image_size)
\ No newline at end of file
@@ -0,0 +1,117 @@
+from functools import cache
+from beartype.typing import Dict, List, Mapping, Optional, Tuple
+import taichi as ti
+import torch
+
+from taichi_splatting.taichi_lib.conversions import torch_taichi
+
+
+@cache
+def nonfinite_kernel(dtype=ti.f32, num_tensors:int=1):
+  # all tensors (of one dtype) are passed in an argpack and checked by a single 
+  # parallel loop over their combined elements - one launch for any number of tensors
+  value_names = [f'values{i}' for i in range(num_tensors)]
+  count_names = [f'count{i}' for i in range(num_tensors)]
+
+  tensors_type = ti.types.argpack(
+    **{name: ti.types.ndarray(dtype, ndim=1) for name in value_names},  # (N) - flattened tensor
+    **{name: ti.types.ndarray(ti.i32, ndim=1) for name in count_names}  # (1) - accumulated count
+  )
+
+  @ti.kernel
+  def count_nonfinite_kernel(
+    tensors: tensors_type,
+    zero_nonfinite: ti.i32
+  ):
+    total = 0
+    for i in ti.static(range(num_tensors)):
+      total += ti.static(getattr(tensors, value_names[i])).shape[0]
+
+    for idx in range(total):
+      start = 0
+      for i in ti.static(range(num_tensors)):
+        values = ti.static(getattr(tensors, value_names[i]))
+        size = values.shape[0]
+
+        if idx >= start and idx < start + size:
+          v = values[idx - start]
+          if ti.math.isnan(v) or ti.math.isinf(v):
+            ti.atomic_add(ti.static(getattr(tensors, count_names[i]))[0], 1)
+
+            if zero_nonfinite:
+              values[idx - start] = 0
+        start += size
+
+  def f(values:List[torch.Tensor], counts:List[torch.Tensor], zero_nonfinite:bool):
+    tensors = tensors_type(**dict(zip(value_names, values)), **dict(zip(count_names, counts)))
+    count_nonfinite_kernel(tensors, zero_nonfinite)
+
+  return f
+
+
+def named_tensors(t, name:str) -> List[Tuple[str, torch.Tensor]]:
+  """ floating point tensors (and their gradients) in t, with names """
+  tensors = []
+
+  if isinstance(t, torch.Tensor):
+    if t.is_floating_point() and t.numel() > 0:
+      tensors.append((name, t.detach()))
+
+    if t.grad is not None:
+      tensors.extend(named_tensors(t.grad, f'{name}.grad'))
+
+  if isinstance(t, Mapping):
+    for k, v in t.items():
+      tensors.extend(named_tensors(v, f'{name}.{k}'))
+
+  return tensors
+
+
+def count_nonfinite(t, name:str, counts:Optional[Dict[str, torch.Tensor]]=None,
+                    zero_nonfinite:bool=False) -> Dict[str, torch.Tensor]:
+  """
+  Accumulate counts of non-finite values in tensors (and their gradients)
+  into device side counters, without synchronizing with the host.
+  One kernel is launched for each dtype (and device).
+
+  Parameters:
+    t: torch.Tensor or Mapping of tensors to check (must be contiguous)
+    name: str - name used to report counts
+    counts: Dict[str, torch.Tensor] - counters from a previous call to accumulate into
+    zero_nonfinite: bool - set non-finite values to zero (in place)
+
+  Returns:
+    counts: Dict[str, torch.Tensor] - (1, ) int32 counters for each tensor, see check_counts
+  """
+  if counts is None:
+    counts = {}
+
+  groups = {}
+  for k, v in named_tensors(t, name):
+    # tensors are checked (and zeroed) in place through a flattened view
+    assert v.is_contiguous(), f"count_nonfinite: {k} must be contiguous"
+
+    if k not in counts:
+      counts[k] = torch.zeros((1, ), dtype=torch.int32, device=v.device)
+    groups.setdefault((v.dtype, v.device), []).append((k, v))
+
+  for (dtype, _), group in groups.items():
+    kernel = nonfinite_kernel(torch_taichi[dtype], len(group))
+    kernel([v.view(-1) for _, v in group], [counts[k] for k, _ in group], zero_nonfinite)
+
+  return counts
+
+
+def check_counts(counts:Dict[str, torch.Tensor], warn:bool=False):
+  """ Read counters from count_nonfinite (a single host sync)
+      and warn or raise a ValueError if any non-finite values were found. """
+  if len(counts) == 0:
+    return
+
+  totals = torch.cat(list(counts.values())).cpu().tolist()
+  for name, n in zip(counts.keys(), totals):
+    if n > 0:
+      if warn:
+        print(f'Found {n} non-finite values in {name}')
+      else:
+        raise ValueError(f'Found {n} non-finite values in {name}')
@@ -0,0 +1,93 @@
+from functools import cache
+import taichi as ti
+import torch
+
+from taichi_splatting.misc.autograd import restore_grad
+
+from taichi_splatting.taichi_lib import get_library
+from taichi_splatting.taichi_lib.conversions import torch_taichi
+
+
+@cache
+def project_gaussians2d_function(torch_dtype=torch.float32):
+  dtype = torch_taichi[torch_dtype]
+  lib = get_library(dtype)
+
+
+  @ti.kernel
+  def project_gaussians2d_kernel(
+    position: ti.types.ndarray(lib.vec2, ndim=1),  # (N, 2)
+    log_scaling: ti.types.ndarray(lib.vec2, ndim=1),  # (N, 2)
+    rotation: ti.types.ndarray(lib.vec2, ndim=1),  # (N, 2)
+    alpha_logit: ti.types.ndarray(dtype, ndim=1),  # (N)
+
+    points: ti.types.ndarray(lib.Gaussian2D.vec, ndim=1),  # (N, 6)
+  ):
+
+    for i in range(position.shape[0]):
+      c, s = ti.math.normalize(rotation[i])
+      inv_var = ti.exp(-2. * log_scaling[i])
+
+      # conic is the analytic inverse of the covariance R^T S^2 R, 
+      # where R = [[c, -s], [s, c]] and S = diag(scale)
+      uv_conic = lib.vec3(
+        c * c * inv_var.x + s * s * inv_var.y,
+        c * s * (inv_var.y - inv_var.x),
+        s * s * inv_var.x + c * c * inv_var.y)
+
+      points[i] = lib.Gaussian2D.to_vec(
+        uv=position[i],
+        uv_conic=uv_conic,
+        alpha=lib.sigmoid(alpha_logit[i]))
+
+
+
+  class _module_function(torch.autograd.Function):
+    @staticmethod
+    def forward(ctx, position, log_scaling, rotation, alpha_logit):
+      n = position.shape[0]
+      points = torch.empty((n, lib.Gaussian2D.vec.n), dtype=position.dtype, device=position.device)
+
+      gaussian_tensors = (position, log_scaling, rotation, alpha_logit)
+      project_gaussians2d_kernel(*gaussian_tensors, points)
+
+      ctx.save_for_backward(*gaussian_tensors, points)
+      return points
+
+    @staticmethod
+    def backward(ctx, dpoints):
+      gaussian_tensors = ctx.saved_tensors[:4]
+      points = ctx.saved_tensors[4]
+
+      with restore_grad(*gaussian_tensors, points):
+        points.grad = dpoints.contiguous()
+        project_gaussians2d_kernel.grad(*gaussian_tensors, points)
+
+        return tuple(tensor.grad for tensor in gaussian_tensors)
+
+  return _module_function
+
+
+def apply(position:torch.Tensor, log_scaling:torch.Tensor, 
+          rotation:torch.Tensor, alpha_logit:torch.Tensor):
+  
+  _module_function = project_gaussians2d_function(position.dtype)
+  return _module_function.apply(
+    position.contiguous(),
+    log_scaling.contiguous(),
+    rotation.contiguous(),
+    alpha_logit.reshape(-1).contiguous())
+
+
+def project_gaussians2d(points) -> torch.Tensor:
+    """
+    Fused "projection" of 2D Gaussian parameters to the packed conic-based
+    representation used by the tile-mapper and rasterizer.
+    Args:
+        points: The Gaussians2D parameters to be "projected".
+    Returns:
+        torch.Tensor [N, 6] the packed
+        conic-based representation of the Gaussians2D object.
+    """
+    return apply(points.position, points.log_scaling, 
+                 points.rotation, points.alpha_logit)
@@ -2,7 +2,8 @@ from functools import cache
 import taichi as ti
 from taichi_splatting.data_types import RasterConfig
 from taichi_splatting.rasterizer import tiling
-from taichi_splatting.taichi_lib.concurrent import WARP_SIZE, block_reduce_i32, warp_add_vector_32, warp_add_vector_64
+from taichi_splatting.taichi_lib.concurrent import (WARP_SIZE, block_reduce_i32, 
+  warp_add_vector_32, warp_add_vector_64, warp_add_scalar_32, warp_add_scalar_64)
 
 from taichi_splatting.taichi_lib import get_library
 from taichi.math import ivec2
@@ -19,13 +20,25 @@ def backward_kernel(config: RasterConfig,
                     dtype=ti.f32):
   
   lib = get_library(dtype)
-  Gaussian2D, vec2 = lib.Gaussian2D, lib.vec2
+  Gaussian2D, vec2, vec3 = lib.Gaussian2D, lib.vec2, lib.vec3
   warp_add_vector = warp_add_vector_32 if dtype == ti.f32 else warp_add_vector_64
+  warp_add_scalar = warp_add_scalar_32 if dtype == ti.f32 else warp_add_scalar_64
 
   feature_vec = ti.types.vector(feature_size, dtype=dtype)
+
+  # features may be stored at half precision in shared memory (accumulated at full precision)
+  shared_feature_type = ti.f16 if config.use_fp16_features else dtype
+  shared_feature_vec = ti.types.vector(feature_size, dtype=shared_feature_type)
+
+  # likewise conic and alpha, uv is always full precision (half precision is too coarse for pixel positions)
+  shared_conic_type = ti.f16 if config.use_fp16_conic else dtype
+  shared_conic_vec = ti.types.vector(3, dtype=shared_conic_type)
   tile_size = config.tile_size
   tile_area = tile_size * tile_size
 
+  # number of raster tiles (in each axis) in a macro tile of the tile mapper
+  macro_tiles = config.map_tile_size // tile_size
+
   thread_pixels = config.pixel_stride[0] * config.pixel_stride[1]
   block_area = tile_area // thread_pixels
   
@@ -65,27 +78,42 @@ def backward_kernel(config: RasterConfig,
       grad_features: ti.types.ndarray(feature_vec, ndim=1),  # (M, F)
 
       point_split_heuristics: ti.types.ndarray(vec2, ndim=1),  # (M)
-  ):
 
-    camera_height, camera_width = image_alpha.shape
+      # (padded) image size in tiles, compile time constants (one kernel per image size)
+      tiles_wide: ti.template(),
+      tiles_high: ti.template(),
+  ):
 
-    # round up
-    tiles_wide = (camera_width + tile_size - 1) // tile_size 
-    tiles_high = (camera_height + tile_size - 1) // tile_size
+    # images are padded to a multiple of map_tile_size (see function.py), 
+    # so there is no bounds check on pixels
+    macro_tiles_wide = ti.static(tiles_wide // macro_tiles)
 
-    # see forward.py for explanation of tile_id and tile_idx and blocking
+    # see forward.py for explanation of block order, tile_id and tile_idx and blocking
     ti.loop_config(block_dim=(block_area))
-    for tile_id, tile_idx in ti.ndrange(tiles_wide * tiles_high, block_area):
+    for block_id, tile_idx in ti.ndrange(tiles_wide * tiles_high, block_area):
+      tile = tiling.tile_order(block_id, tiles_wide, tiles_high)
+      tile_u, tile_v = tile.x, tile.y
+
+      tile_id = tile_u + tile_v * tiles_wide
       pixel_base = tiling.tile_transform(tile_id, tile_idx, 
                         tile_size, config.pixel_stride, tiles_wide)
 
 
-      # open the shared memory
+      # open the shared memory (struct of arrays, for fewer bank conflicts)
       tile_point_id = ti.simt.block.SharedArray((block_area, ), dtype=ti.i32)
-      tile_point = ti.simt.block.SharedArray((block_area, ), dtype=Gaussian2D.vec)
-      tile_feature = ti.simt.block.SharedArray((block_area, ), dtype=feature_vec)
+      tile_has_grad = ti.simt.block.SharedArray((block_area, ), dtype=ti.i32)
 
-      tile_grad_point = (ti.simt.block.SharedArray((block_area, ), dtype=Gaussian2D.vec)
+      tile_uv = ti.simt.block.SharedArray((block_area, ), dtype=vec2)
+      tile_conic = ti.simt.block.SharedArray((block_area, ), dtype=shared_conic_vec)
+      tile_alpha = ti.simt.block.SharedArray((block_area, ), dtype=shared_conic_type)
+      tile_power_cutoff = ti.simt.block.SharedArray((block_area, ), dtype=dtype)
+      tile_feature = ti.simt.block.SharedArray((block_area, ), dtype=shared_feature_vec)
+
+      tile_grad_uv = (ti.simt.block.SharedArray((block_area, ), dtype=vec2)
+        if ti.static(points_requires_grad) else None)
+      tile_grad_conic = (ti.simt.block.SharedArray((block_area, ), dtype=vec3)
+        if ti.static(points_requires_grad) else None)
+      tile_grad_alpha = (ti.simt.block.SharedArray((block_area, ), dtype=dtype)
         if ti.static(points_requires_grad) else None)
       
       tile_grad_feature = (ti.simt.block.SharedArray((block_area,), dtype=feature_vec)
@@ -103,15 +131,17 @@ def backward_kernel(config: RasterConfig,
       for i, offset in ti.static(pixel_tile):
         pixel = ivec2(offset) + pixel_base
 
-        if pixel.y < camera_height and pixel.x < camera_width:
-          last_point_pixel[i] = image_last_valid[pixel.y, pixel.x]
-          T_i[i] = 1.0 - image_alpha[pixel.y, pixel.x]
-          grad_pixel_feature[i, :] = grad_image_feature[pixel.y, pixel.x]
-          #pixel_feature[i, :] = image_feature[pixel.y, pixel.x]
+        last_point_pixel[i] = image_last_valid[pixel.y, pixel.x]
+        T_i[i] = 1.0 - image_alpha[pixel.y, pixel.x]
+        grad_pixel_feature[i, :] = grad_image_feature[pixel.y, pixel.x]
+        #pixel_feature[i, :] = image_feature[pixel.y, pixel.x]
 
       last_point_thread = last_point_pixel.max()
       w_i = thread_features(0.0)
 
+      # pixel centers are loop invariant, offsets within the thread's pixels are static
+      pixel_center = ti.cast(pixel_base, dtype) + 0.5
+
       #  T_i = \prod_{j=1}^{i-1} (1 - a_j) \\
       #  \frac{dC}{da_i} = c_i T(i) - \frac{1}{1 - a_i} \\
       #  \sum_{j=i+1}^{n} c_j a_j T(j) \\
@@ -123,11 +153,18 @@ def backward_kernel(config: RasterConfig,
       # fine tune the end offset to the actual number of points renderered
       end_offset = block_reduce_i32(last_point_thread, ti.max, ti.atomic_max, 0)
 
-      start_offset, _ = tile_overlap_ranges[tile_id]
+      # raster tiles in the same macro tile share the range of points of the macro tile
+      macro_tile_id = tile_u // macro_tiles + (tile_v // macro_tiles) * macro_tiles_wide
+      start_offset, _ = tile_overlap_ranges[macro_tile_id]
       tile_point_count = end_offset - start_offset
 
       num_point_groups = (tile_point_count + ti.static(block_area - 1)) // block_area
 
+      # overlap_to_point read issued one group ahead (see forward.py)
+      next_point_idx = 0
+      if end_offset - tile_idx - 1 >= 0:
+        next_point_idx = overlap_to_point[end_offset - tile_idx - 1]
+
       # Loop through the range in groups of block_area
       for point_group_id in range(num_point_groups):
         ti.simt.block.sync() 
@@ -140,14 +177,22 @@ def backward_kernel(config: RasterConfig,
 
         load_index = block_end_idx - tile_idx - 1
         if load_index >= block_start_idx:
-          point_idx = overlap_to_point[load_index]
+          point_idx = next_point_idx
 
           tile_point_id[tile_idx] = point_idx
-          tile_point[tile_idx] = points[point_idx]
-          tile_feature[tile_idx] = point_features[point_idx]
+          tile_has_grad[tile_idx] = 0
+
+          uv, uv_conic, point_alpha = Gaussian2D.unpack(points[point_idx])
+          tile_uv[tile_idx] = uv
+          tile_conic[tile_idx] = ti.cast(uv_conic, shared_conic_type)
+          tile_alpha[tile_idx] = ti.cast(point_alpha, shared_conic_type)
+          tile_power_cutoff[tile_idx] = ti.log(ti.static(config.alpha_threshold) / point_alpha)
+          tile_feature[tile_idx] = ti.cast(point_features[point_idx], shared_feature_type)
 
           if ti.static(points_requires_grad):
-            tile_grad_point[tile_idx] = Gaussian2D.vec(0.0)
+            tile_grad_uv[tile_idx] = vec2(0.0)
+            tile_grad_conic[tile_idx] = vec3(0.0)
+            tile_grad_alpha[tile_idx] = 0.0
 
           if ti.static(features_requires_grad):
             tile_grad_feature[tile_idx] = feature_vec(0.0)
@@ -155,6 +200,9 @@ def backward_kernel(config: RasterConfig,
           if ti.static(compute_split_heuristics):
             tile_split_heuristics[tile_idx] = vec2(0.0)
 
+        if load_index - block_area >= 0:
+          next_point_idx = overlap_to_point[load_index - block_area]
+
         point_group_size = ti.min(
           block_area, tile_point_count - group_offset_base)
                     
@@ -164,43 +212,56 @@ def backward_kernel(config: RasterConfig,
         for in_group_idx in range(point_group_size):
           point_index = end_offset - (group_offset_base + in_group_idx)
 
-          uv, uv_conic, point_alpha = Gaussian2D.unpack(tile_point[in_group_idx])
+          uv = tile_uv[in_group_idx]
+          uv_conic = ti.cast(tile_conic[in_group_idx], dtype)
+          point_alpha = ti.cast(tile_alpha[in_group_idx], dtype)
 
-          grad_point = Gaussian2D.vec(0.0)
+          grad_uv = vec2(0.0)
+          grad_conic = vec3(0.0)
+          grad_alpha = dtype(0.0)
           grad_feature = feature_vec(0.0)
           contribution = vec2(0.0)
 
-          has_grad = False
+          feature = ti.cast(tile_feature[in_group_idx], dtype)
+
+          # early out (see forward.py) - skip the exp and derivatives 
+          # unless at least one of the thread's pixels is in range
+          power_cutoff = tile_power_cutoff[in_group_idx]
+          pixel_in_range = thread_index(0)
           for i, offset in ti.static(pixel_tile):
-            pixel = ti.cast(pixel_base, dtype) + vec2(offset) + 0.5
+            power = lib.conic_power(pixel_center + vec2(offset), uv, uv_conic)
+            pixel_in_range[i] = ti.i32((power >= power_cutoff) and (point_index <= last_point_pixel[i]))
 
-            gaussian_alpha, dp_dmean, dp_dconic = lib.conic_pdf_with_grad(pixel, uv, uv_conic)
-            
-            alpha = point_alpha * gaussian_alpha
-            pixel_grad = (alpha >= ti.static(config.alpha_threshold)) and (point_index <= last_point_pixel[i])      
-      
-            if pixel_grad:
-              has_grad = True
+          has_grad = False
+          if pixel_in_range.any():
+            for i, offset in ti.static(pixel_tile):
+              pixel = pixel_center + vec2(offset)
+
+              gaussian_alpha, dp_dmean, dp_dconic = lib.conic_pdf_with_grad(pixel, uv, uv_conic)
+              
+              alpha = point_alpha * gaussian_alpha
+              pixel_grad = (pixel_in_range[i] != 0) and (alpha >= ti.static(config.alpha_threshold))
+              has_grad = has_grad or pixel_grad
+
+              # masked (branchless) update, pixels without a gradient contribute zero
               alpha = ti.min(alpha, ti.static(config.clamp_max_alpha))
-              T_i[i] /= (1. - alpha)
+              T_i[i] = ti.select(pixel_grad, T_i[i] / (1. - alpha), T_i[i])
 
-              feature = tile_feature[in_group_idx]
-              weight = alpha * T_i[i]
+              weight = ti.select(pixel_grad, alpha * T_i[i], 0.)
 
               grad_feature += weight * grad_pixel_feature[i, :]          
               feature_diff = (feature * T_i[i] - w_i[i, :] / (1. - alpha))
-              
+            
                 # \frac{dC}{da_i} = c_i T(i) - \frac{1}{1 - a_i} w_i
               alpha_grad_from_feature = feature_diff * grad_pixel_feature[i, :]
 
               # w_{i-1} = w_i + c_i a_i T(i)
               w_i[i, :] += feature * weight
-              alpha_grad: dtype = alpha_grad_from_feature.sum()
+              alpha_grad: dtype = ti.select(pixel_grad, alpha_grad_from_feature.sum(), 0.)
 
-              grad_point += alpha_grad * Gaussian2D.to_vec(
-                  point_alpha * dp_dmean, 
-                  point_alpha * dp_dconic,
-                  gaussian_alpha)
+              grad_uv += alpha_grad * point_alpha * dp_dmean
+              grad_conic += alpha_grad * point_alpha * dp_dconic
+              grad_alpha += alpha_grad * gaussian_alpha
 
 
               if ti.static(compute_split_heuristics):
@@ -210,11 +271,14 @@ def backward_kernel(config: RasterConfig,
                 )
 
           if ti.simt.warp.any_nonzero(ti.u32(0xffffffff), ti.i32(has_grad)):
+            tile_has_grad[in_group_idx] = 1
 
             # Accumulating gradients in block shared memory does not appear to be faster
             # on it's own, but combined with warp sums it seems to be fast
             if ti.static(points_requires_grad):
-              warp_add_vector(tile_grad_point[in_group_idx], grad_point)
+              warp_add_vector(tile_grad_uv[in_group_idx], grad_uv)
+              warp_add_vector(tile_grad_conic[in_group_idx], grad_conic)
+              warp_add_scalar(tile_grad_alpha[in_group_idx], grad_alpha)
             
             if ti.static(features_requires_grad):
               warp_add_vector(tile_grad_feature[in_group_idx], grad_feature)
@@ -225,11 +289,13 @@ def backward_kernel(config: RasterConfig,
 
         ti.simt.block.sync()
 
-        # finally accumulate gradients in global memory
-        if load_index >= block_start_idx:
+        # finally accumulate gradients in global memory, skipping points with no
+        # contribution in this tile (avoids contended atomics on points with many overlaps)
+        if load_index >= block_start_idx and tile_has_grad[tile_idx] != 0:
           point_offset = tile_point_id[tile_idx] 
           if ti.static(points_requires_grad):
-            ti.atomic_add(grad_points[point_offset], tile_grad_point[tile_idx])
+            ti.atomic_add(grad_points[point_offset], Gaussian2D.to_vec(
+              tile_grad_uv[tile_idx], tile_grad_conic[tile_idx], tile_grad_alpha[tile_idx]))
 
           if ti.static(features_requires_grad):
             ti.atomic_add(grad_features[point_offset], tile_grad_feature[tile_idx])
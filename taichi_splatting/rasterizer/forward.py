@@ -1,9 +1,11 @@
 
 from functools import cache
 import taichi as ti
+from taichi.math import ivec2
 from taichi_splatting.data_types import RasterConfig
 from taichi_splatting.rasterizer import tiling
 from taichi_splatting.taichi_lib import get_library
+from taichi_splatting.taichi_lib.concurrent import WARP_SIZE
 
 
 
@@ -11,12 +13,40 @@ from taichi_splatting.taichi_lib import get_library
 def forward_kernel(config: RasterConfig, feature_size: int, dtype=ti.f32):
 
   lib = get_library(dtype)
-  Gaussian2D = lib.Gaussian2D
+  Gaussian2D, vec2, vec3 = lib.Gaussian2D, lib.vec2, lib.vec3
 
   feature_vec = ti.types.vector(feature_size, dtype=dtype)
+
+  # features may be stored at half precision in shared memory (accumulated at full precision)
+  shared_feature_type = ti.f16 if config.use_fp16_features else dtype
+  shared_feature_vec = ti.types.vector(feature_size, dtype=shared_feature_type)
+
+  # likewise conic and alpha, uv is always full precision (half precision is too coarse for pixel positions)
+  shared_conic_type = ti.f16 if config.use_fp16_conic else dtype
+  shared_conic_vec = ti.types.vector(3, dtype=shared_conic_type)
   tile_size = config.tile_size
   tile_area = tile_size * tile_size
 
+  # number of raster tiles (in each axis) in a macro tile of the tile mapper
+  macro_tiles = config.map_tile_size // tile_size
+
+  thread_pixels = config.pixel_stride[0] * config.pixel_stride[1]
+  block_area = tile_area // thread_pixels
+  
+  assert block_area >= WARP_SIZE, \
+    f"pixel_stride {config.pixel_stride} and tile_size, {config.tile_size} must allow at least one warp sized ({WARP_SIZE}) tile"
+
+  # each thread is responsible for a small tile of pixels (see backward.py)
+  pixel_tile = tuple([ (i, 
+            (i % config.pixel_stride[0],
+            i // config.pixel_stride[0]))
+              for i in range(thread_pixels) ])
+
+  # types for each thread to keep state in it's tile of pixels
+  thread_features = ti.types.matrix(thread_pixels, feature_size, dtype=dtype)
+  thread_vector = ti.types.vector(thread_pixels, dtype=dtype)
+  thread_index = ti.types.vector(thread_pixels, dtype=ti.i32)
+
 
   @ti.kernel
   def _forward_kernel(
@@ -33,107 +63,136 @@ def forward_kernel(config: RasterConfig, feature_size: int, dtype=ti.f32):
       # needed for backward
       image_alpha: ti.types.ndarray(dtype, ndim=2),       # H, W
       image_last_valid: ti.types.ndarray(ti.i32, ndim=2),  # H, W
-  ):
 
-    camera_height, camera_width = image_feature.shape
+      # (padded) image size in tiles, compile time constants (one kernel per image size)
+      tiles_wide: ti.template(),
+      tiles_high: ti.template(),
+  ):
 
-    # round up
-    tiles_wide = (camera_width + tile_size - 1) // tile_size 
-    tiles_high = (camera_height + tile_size - 1) // tile_size
+    # images are padded to a multiple of map_tile_size (see function.py), 
+    # so there is no bounds check on pixels
+    macro_tiles_wide = ti.static(tiles_wide // macro_tiles)
 
-    # put each tile_size * tile_size tile in the same CUDA thread group (block)
+    # put each tile in the same CUDA thread group (block), each thread renders pixel_stride pixels
+    # blocks are launched in morton order within super tiles (see tiling.tile_order),
+    # so neighbouring blocks share more of the points they read
     # tile_id is the index of the tile in the (tiles_wide x tiles_high) grid
-    # tile_idx is the index of the pixel in the tile
-    # pixels are blocked first by tile_id, then by tile_idx into (8x4) warps
-    
-    ti.loop_config(block_dim=(tile_area))
-
-    
-    for tile_id, tile_idx in ti.ndrange(tiles_wide * tiles_high, tile_area):
+    # tile_idx is the index of the thread in the tile
+    # threads are blocked first by tile_id, then by tile_idx into (8x4) warps
+    ti.loop_config(block_dim=(block_area))
+    for block_id, tile_idx in ti.ndrange(tiles_wide * tiles_high, block_area):
+      tile = tiling.tile_order(block_id, tiles_wide, tiles_high)
+      tile_u, tile_v = tile.x, tile.y
+
+      tile_id = tile_u + tile_v * tiles_wide
+      pixel_base = tiling.tile_transform(tile_id, tile_idx, 
+                        tile_size, config.pixel_stride, tiles_wide)
+      pixel_center = ti.cast(pixel_base, dtype) + 0.5
+
+      # open the shared memory (struct of arrays, for fewer bank conflicts)
+      tile_uv = ti.simt.block.SharedArray((block_area, ), dtype=vec2)
+      tile_conic = ti.simt.block.SharedArray((block_area, ), dtype=shared_conic_vec)
+      tile_alpha = ti.simt.block.SharedArray((block_area, ), dtype=shared_conic_type)
+      tile_power_cutoff = ti.simt.block.SharedArray((block_area, ), dtype=dtype)
+      tile_feature = ti.simt.block.SharedArray((block_area, ), dtype=shared_feature_vec)
+
+      # raster tiles in the same macro tile share the range of points of the macro tile
+      macro_tile_id = tile_u // macro_tiles + (tile_v // macro_tiles) * macro_tiles_wide
+      start_offset, end_offset = tile_overlap_ranges[macro_tile_id]
+      tile_point_count = end_offset - start_offset
 
-      pixel = tiling.tile_transform(tile_id, tile_idx, tile_size, (1, 1), tiles_wide)
-      pixelf = ti.cast(pixel, dtype) + 0.5
+      num_point_groups = (tile_point_count + ti.static(block_area - 1)) // block_area
 
       # The initial value of accumulated alpha (initial value of accumulated multiplication)
-      T_i = dtype(1.0)
-      accum_feature = feature_vec(0.)
-
-      # open the shared memory
-      tile_point = ti.simt.block.SharedArray((tile_area, ), dtype=Gaussian2D.vec)
-      tile_feature = ti.simt.block.SharedArray((tile_area, ), dtype=feature_vec)
-
-      start_offset, end_offset = tile_overlap_ranges[tile_id]
-      tile_point_count = end_offset - start_offset
+      T_i = thread_vector(1.0)
+      accum_feature = thread_features(0.)
 
-      num_point_groups = (tile_point_count + ti.static(tile_area - 1)) // tile_area
-      pixel_saturated = False
-      last_point_idx = start_offset
+      pixel_saturated = thread_index(0)
+      last_point_idx = thread_index(start_offset)
 
+      # the overlap_to_point read (contiguous across the block) is issued one group ahead,
+      # so it is not on the critical path of the gather from points/point_features
+      next_point_idx = 0
+      if start_offset + tile_idx < end_offset:
+        next_point_idx = overlap_to_point[start_offset + tile_idx]
 
-      # Loop through the range in groups of tile_area
+      # Loop through the range in groups of block_area
       for point_group_id in range(num_point_groups):
 
         ti.simt.block.sync()
 
         # The offset of the first point in the group
-        group_start_offset = start_offset + point_group_id * tile_area
+        group_start_offset = start_offset + point_group_id * block_area
 
         # each thread in a block loads one point into shared memory
         # then all threads in the block process those points sequentially
         load_index = group_start_offset + tile_idx
 
         if load_index < end_offset:
-          point_idx = overlap_to_point[load_index]
+          point_idx = next_point_idx
 
-  
-          tile_point[tile_idx] = points[point_idx]
-          tile_feature[tile_idx] = point_features[point_idx]
+          uv, uv_conic, point_alpha = Gaussian2D.unpack(points[point_idx])
+          tile_uv[tile_idx] = uv
+          tile_conic[tile_idx] = ti.cast(uv_conic, shared_conic_type)
+          tile_alpha[tile_idx] = ti.cast(point_alpha, shared_conic_type)
+          # alpha < alpha_threshold where conic_power < log(alpha_threshold / point_alpha)
+          tile_power_cutoff[tile_idx] = ti.log(ti.static(config.alpha_threshold) / point_alpha)
+          tile_feature[tile_idx] = ti.cast(point_features[point_idx], shared_feature_type)
+
+        if load_index + block_area < end_offset:
+          next_point_idx = overlap_to_point[load_index + block_area]
 
 
         ti.simt.block.sync()
 
         max_point_group_offset: ti.i32 = ti.min(
-            tile_area, tile_point_count - point_group_id * tile_area)
+            block_area, tile_point_count - point_group_id * block_area)
 
         # in parallel across a block, render all points in the group
         for in_group_idx in range(max_point_group_offset):
-          if pixel_saturated:
+          # stop when all of the thread's pixels are saturated
+          if pixel_saturated.all():
             break
 
-          uv, uv_conic, point_alpha = Gaussian2D.unpack(tile_point[in_group_idx])
-          gaussian_alpha = lib.conic_pdf(pixelf, uv, uv_conic)
-          alpha = point_alpha * gaussian_alpha
+          uv = tile_uv[in_group_idx]
+          uv_conic = ti.cast(tile_conic[in_group_idx], dtype)
+          power_cutoff = tile_power_cutoff[in_group_idx]
+
+          for i, offset in ti.static(pixel_tile):
+            # early out before the exp for pixels which are certain to be below alpha_threshold
+            power = lib.conic_power(pixel_center + vec2(offset), uv, uv_conic)
+            if power >= power_cutoff and not pixel_saturated[i]:
+              alpha = ti.cast(tile_alpha[in_group_idx], dtype) * ti.exp(power)
 
-            
-          # from paper: we skip any blending updates with 𝛼 < 𝜖 (we choose 𝜖 as 1
-          # 255 ) and also clamp 𝛼 with 0.99 from above.
-          if alpha < ti.static(config.alpha_threshold):
-            continue
+              # from paper: we skip any blending updates with 𝛼 < 𝜖 (we choose 𝜖 as 1
+              # 255 ) and also clamp 𝛼 with 0.99 from above.
+              if alpha >= ti.static(config.alpha_threshold):
+                alpha = ti.min(alpha, ti.static(config.clamp_max_alpha))
 
-          alpha = ti.min(alpha, ti.static(config.clamp_max_alpha))
-          # from paper: before a Gaussian is included in the forward rasterization
-          # pass, we compute the accumulated opacity if we were to include it
-          # and stop front-to-back blending before it can exceed 0.9999.
-          next_T_i = T_i * (1 - alpha)
-          if next_T_i < ti.static(1 - config.saturate_threshold):
-            pixel_saturated = True
-            continue  # somehow faster than directly breaking
-          last_point_idx = group_start_offset + in_group_idx + 1
+                # from paper: before a Gaussian is included in the forward rasterization
+                # pass, we compute the accumulated opacity if we were to include it
+                # and stop front-to-back blending before it can exceed 0.9999.
+                next_T_i = T_i[i] * (1 - alpha)
+                if next_T_i < ti.static(1 - config.saturate_threshold):
+                  pixel_saturated[i] = 1
+                else:
+                  last_point_idx[i] = group_start_offset + in_group_idx + 1
 
-          # weight = alpha * T_i
-          accum_feature += tile_feature[in_group_idx] * alpha * T_i
-          T_i = next_T_i
+                  # weight = alpha * T_i
+                  accum_feature[i, :] += ti.cast(tile_feature[in_group_idx], dtype) * alpha * T_i[i]
+                  T_i[i] = next_T_i
 
 
         # end of point group loop
       # end of point group id loop
 
-      if pixel.x < camera_width and pixel.y < camera_height:
-        image_feature[pixel.y, pixel.x] = accum_feature
+      for i, offset in ti.static(pixel_tile):
+        pixel = ivec2(offset) + pixel_base
+        image_feature[pixel.y, pixel.x] = accum_feature[i, :]
 
         # No need to accumulate a normalisation factor as it is exactly 1 - T_i
-        image_alpha[pixel.y, pixel.x] = 1. - T_i    
-        image_last_valid[pixel.y, pixel.x] = last_point_idx
+        image_alpha[pixel.y, pixel.x] = 1. - T_i[i]    
+        image_last_valid[pixel.y, pixel.x] = last_point_idx[i]
 
     # end of pixel loop
 
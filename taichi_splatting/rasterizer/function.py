@@ -1,6 +1,6 @@
 
 from functools import cache
-from taichi_splatting.mapper.tile_mapper import map_to_tiles
+from taichi_splatting.mapper.tile_mapper import map_to_tiles, pad_to_tile
 from taichi_splatting.taichi_lib.concurrent import WARP_SIZE
 
 
@@ -42,6 +42,8 @@ def render_function(config:RasterConfig,
         
 
       shape = (image_size[1], image_size[0])
+      # image_size is padded to a multiple of the tile size
+      tiles_wide, tiles_high = (image_size[0] // config.tile_size, image_size[1] // config.tile_size)
       image_feature = torch.empty((*shape, features.shape[1]),
                                   dtype=dtype, device=features.device)
       image_alpha = torch.empty(shape, dtype=dtype, device=features.device)
@@ -53,7 +55,8 @@ def render_function(config:RasterConfig,
 
       forward(gaussians, features, 
         tile_overlap_ranges, overlap_to_point,
-        image_feature, image_alpha, image_last_valid)
+        image_feature, image_alpha, image_last_valid,
+        tiles_wide, tiles_high)
 
       # Non differentiable parameters
       ctx.overlap_to_point = overlap_to_point
@@ -61,6 +64,7 @@ def render_function(config:RasterConfig,
       ctx.image_last_valid = image_last_valid
       ctx.image_alpha = image_alpha
       ctx.image_size = image_size
+      ctx.tiles = (tiles_wide, tiles_high)
       ctx.point_split_heuristics = point_split_heuristics
 
       ctx.mark_non_differentiable(image_alpha, image_last_valid, point_split_heuristics, overlap_to_point, tile_overlap_ranges)
@@ -82,7 +86,8 @@ def render_function(config:RasterConfig,
           ctx.tile_overlap_ranges, ctx.overlap_to_point,
           ctx.image_alpha, ctx.image_last_valid,
           grad_image_feature.contiguous(),
-          grad_gaussians, grad_features, ctx.point_split_heuristics)
+          grad_gaussians, grad_features, ctx.point_split_heuristics,
+          *ctx.tiles)
 
         return grad_gaussians, grad_features, None, None, None, None
   return _module_function
@@ -105,7 +110,7 @@ def rasterize_with_tiles(gaussians2d: torch.Tensor, features: torch.Tensor,
       gaussians2d: (N, 6)  packed gaussians, N is the number of gaussians
       features: (N, F)   features, F is the number of features
 
-      tile_overlap_ranges: (TH * TW, 2) M is the number of tiles, 
+      tile_overlap_ranges: (TH * TW, 2) for the grid of macro tiles (config.map_tile_size), 
         maps tile index to range of overlap indices (0..K]
       overlap_to_point: (K, )  K is the number of overlaps, 
         maps overlap index to point index (0..N]
@@ -120,6 +125,10 @@ def rasterize_with_tiles(gaussians2d: torch.Tensor, features: torch.Tensor,
         image_weight: (H, W) torch tensor, where H, W are the image height and width
         point_split_heuristics: (N, ) torch tensor, where N is the number of gaussians  
   """
+  # render with padding to map_tile_size (so the kernels need no bounds checks), 
+  # then crop back to original size
+  padded_size = pad_to_tile(image_size, config.map_tile_size)
+
   _module_function = render_function(config, gaussians2d.requires_grad,
                                       features.requires_grad,
                                       compute_split_heuristics, 
@@ -128,8 +137,12 @@ def rasterize_with_tiles(gaussians2d: torch.Tensor, features: torch.Tensor,
 
   image, image_weight, point_split_heuristics = _module_function.apply(gaussians2d, features, 
           overlap_to_point, tile_overlap_ranges, 
-          image_size)
+          padded_size)
   
+  if padded_size != tuple(image_size):
+    w, h = image_size
+    image, image_weight = image[:h, :w], image_weight[:h, :w]
+
   return RasterOut(image, image_weight, point_split_heuristics)
 
 
@@ -160,7 +173,6 @@ def rasterize(gaussians2d:torch.Tensor, encoded_depths:torch.Tensor,
   assert gaussians2d.shape[0] == encoded_depths.shape[0] == features.shape[0], \
     f"Size mismatch: got {gaussians2d.shape}, {encoded_depths.shape}, {features.shape}"
 
-  # render with padding to tile_size, later crop back to original size
   overlap_to_point, tile_overlap_ranges = map_to_tiles(gaussians2d, encoded_depths, 
     image_size=image_size, config=config)
   
@@ -2,33 +2,10 @@ import taichi as ti
 from taichi.math import ivec2
 
 from taichi_splatting.taichi_lib.concurrent import WARP_SIZE
+from taichi_splatting.taichi_lib.morton import morton_tile_inv
 
-@ti.func
-def interleave(x:ti.i32):
-    x = ( x | ( x << 4 ) ) & 0x0F0F0F0F
-    x = ( x | ( x << 2 ) ) & 0x33333333
-    x = ( x | ( x << 1 ) ) & 0x55555555
-    return x
-
-
-@ti.func
-def deinterleave(x:ti.i32):
-  x &= 0x55555555                   
-  x = (x ^ (x >>  1)) & 0x33333333 
-  x = (x ^ (x >>  2)) & 0x0f0f0f0f
-  return x
-
-
-@ti.func
-def morton_tile(x:ti.i32, y:ti.i32):
-    order = interleave(x) | ( interleave(y) << 1 )
-    return order
-
-@ti.func
-def morton_tile_inv(order:ti.i32):
-  x = deinterleave(order)
-  y = deinterleave(order >> 1)
-  return x, y
+# blocks are launched in morton order within super tiles of (super_tile_size x super_tile_size) tiles
+super_tile_size = 4
 
 
 @ti.func
@@ -64,3 +41,35 @@ def tile_transform(tile_id:ti.i32, tile_idx:ti.i32,
     pixel = ivec2(tile_u, tile_v) * tile_size + ivec2(u, v) 
     return pixel
 
+
+@ti.func
+def tile_order(block_id:ti.i32, tiles_wide:ti.template(), tiles_high:ti.template()):
+  # maps block_id in [0, tiles_wide * tiles_high) to a tile, exactly once each:
+  # morton (z-order) within full super tiles, super tiles row-major, 
+  # then the remaining tiles on the right and bottom edges in row-major order
+  s = ti.static(super_tile_size)
+  supers_wide = ti.static(tiles_wide // s)
+  supers_high = ti.static(tiles_high // s)
+
+  num_super = ti.static(supers_wide * supers_high * s * s)
+  right_wide = ti.static(tiles_wide - supers_wide * s)
+  num_right = ti.static(right_wide * supers_high * s)
+
+  tile = ivec2(0, 0)
+  if block_id < num_super:
+    super_id = block_id // ti.static(s * s)
+    u, v = morton_tile_inv(block_id % ti.static(s * s))
+
+    super_tile = ivec2(super_id % ti.static(max(supers_wide, 1)), 
+                       super_id // ti.static(max(supers_wide, 1)))
+    tile = super_tile * s + ivec2(u, v)
+
+  elif block_id < num_super + num_right:
+    i = block_id - num_super
+    tile = ivec2(supers_wide * s + i % ti.static(max(right_wide, 1)), 
+                 i // ti.static(max(right_wide, 1)))
+  else:
+    i = block_id - num_super - num_right
+    tile = ivec2(i % tiles_wide, supers_high * s + i // tiles_wide)
+
+  return tile
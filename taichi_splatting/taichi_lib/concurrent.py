@@ -1,5 +1,4 @@
-
-
+import math
 import taichi as ti
 from taichi.lang.simt import block, warp
 
@@ -91,6 +90,19 @@ def warp_add_vector_64(dest:ti.template(), val: ti.template()):
   return atomic_add_vector(dest, val)
 
 
+@ti.func
+def warp_add_scalar_32(dest:ti.template(), val: ti.f32):
+  val = warp_reduce_f32(val, add)
+  if is_warp_leader():
+    ti.atomic_add(dest, val)
+
+
+@ti.func
+def warp_add_scalar_64(dest:ti.template(), val: ti.template()):
+  # placeholder for testing 64 bit functions only
+  ti.atomic_add(dest, val)
+
+
 @ti.func
 def warp_scan_up(val: ti.template(), op:ti.template()):
     global_tid = block.global_thread_idx()
@@ -136,3 +148,40 @@ def warp_allocate(dest:ti.template(), val: ti.template()):
 
   return prev + (warp_prefix - val)
 
+
+
+@ti.func
+def block_exclusive_scan_i32(val: ti.i32, thread_idx: ti.i32, block_dim: ti.template()):
+  # Blelloch (work efficient) exclusive prefix sum across a block in shared memory
+  # block_dim must be a power of two and all threads in the block must participate
+  # returns (prefix, block_total)
+
+  shared = ti.simt.block.SharedArray((block_dim, ), dtype=ti.i32)
+  shared[thread_idx] = val
+
+  # up-sweep (reduce) phase
+  for level in ti.static(range(int(math.log2(block_dim)))):
+    ti.simt.block.sync()
+    stride = ti.static(2 << level)
+    if (thread_idx + 1) % stride == 0:
+      shared[thread_idx] += shared[thread_idx - ti.static(stride // 2)]
+
+  ti.simt.block.sync()
+  total = shared[block_dim - 1]
+
+  ti.simt.block.sync()
+  if thread_idx == block_dim - 1:
+    shared[thread_idx] = 0
+
+  # down-sweep phase
+  for level in ti.static(reversed(range(int(math.log2(block_dim))))):
+    ti.simt.block.sync()
+    stride = ti.static(2 << level)
+    if (thread_idx + 1) % stride == 0:
+      left = shared[thread_idx - ti.static(stride // 2)]
+      shared[thread_idx - ti.static(stride // 2)] = shared[thread_idx]
+      shared[thread_idx] += left
+
+  ti.simt.block.sync()
+  return shared[thread_idx], total
+
@@ -299,13 +299,17 @@ def make_library(dtype=ti.f32):
 
 
   @ti.func
-  def conic_pdf(xy: vec2, uv: vec2, uv_conic: vec3) -> dtype:
+  def conic_power(xy: vec2, uv: vec2, uv_conic: vec3) -> dtype:
+      # exponent of the (unnormalized) gaussian, conic_pdf = exp(conic_power)
       dx, dy = xy - uv
       a, b, c = uv_conic
 
-      inner = 0.5 * (dx**2 * a + dy**2 * c) + dx * dy * b
-      p = ti.exp(-inner)
-      return p
+      return -(0.5 * (dx**2 * a + dy**2 * c) + dx * dy * b)
+
+
+  @ti.func
+  def conic_pdf(xy: vec2, uv: vec2, uv_conic: vec3) -> dtype:
+      return ti.exp(conic_power(xy, uv, uv_conic))
 
 
   @ti.func
@@ -9,7 +9,49 @@ from taichi_splatting.taichi_lib.f32 import (Gaussian2D,
 
 
 
-def make_grid_query(tile_size:int=16, gaussian_scale:float=3.0, tight_culling:bool=True):
+def make_grid_query(tile_size:int=16, gaussian_scale:float=3.0, 
+                    alpha_threshold:float=1. / 255., tight_culling:bool=True):
+
+  @ti.dataclass
+  class EllipseGridQuery:
+    uv_conic: vec3
+    max_inner: ti.f32
+    rel_min_bound: vec2
+
+    min_tile: ivec2
+    tile_span: ivec2
+
+    @ti.func
+    def test_tile(self, tile_uv: ivec2):
+      lower = self.rel_min_bound + tile_uv * tile_size
+      return box_min_inner(self.uv_conic, lower, lower + tile_size) <= self.max_inner
+      
+    @ti.func 
+    def count_tiles(self) -> ti.i32:
+      count = 0
+      
+      for tile_uv in ti.grouped(ti.ndrange(*self.tile_span)):
+        if self.test_tile(tile_uv):
+          count += 1
+
+      return count
+
+  @ti.func 
+  def ellipse_grid_query(v: Gaussian2D.vec, image_size:ivec2) -> EllipseGridQuery:
+      uv, uv_conic, alpha = Gaussian2D.unpack(v)
+      uv_cov = inverse_cov(uv_conic)
+      max_inner = gaussian_max_inner(alpha)
+
+      min_tile, max_tile = cov_tile_ranges(uv, uv_cov, image_size, max_inner)
+      return EllipseGridQuery(
+        # Find tiles which intersect the ellipse
+        uv_conic = uv_conic,
+        max_inner = max_inner,
+        rel_min_bound = min_tile * tile_size - uv,
+
+        min_tile = min_tile,
+        tile_span = max_tile - min_tile)
+
 
   @ti.dataclass
   class OBBGridQuery:
@@ -36,13 +78,14 @@ def make_grid_query(tile_size:int=16, gaussian_scale:float=3.0, tight_culling:bo
 
   @ti.func 
   def obb_grid_query(v: Gaussian2D.vec, image_size:ivec2) -> OBBGridQuery:
-      uv, uv_conic, _ = Gaussian2D.unpack(v)
+      uv, uv_conic, alpha = Gaussian2D.unpack(v)
       uv_cov = inverse_cov(uv_conic)
+      max_inner = gaussian_max_inner(alpha)
 
-      min_tile, max_tile = cov_tile_ranges(uv, uv_cov, image_size)
+      min_tile, max_tile = cov_tile_ranges(uv, uv_cov, image_size, max_inner)
       return OBBGridQuery(
         # Find tiles which intersect the oriented box
-        inv_basis = cov_inv_basis(uv_cov, gaussian_scale),
+        inv_basis = cov_inv_basis(uv_cov, ti.sqrt(2 * ti.max(max_inner, 0.))),
         rel_min_bound = min_tile * tile_size - uv,
 
         min_tile = min_tile,
@@ -71,15 +114,51 @@ def make_grid_query(tile_size:int=16, gaussian_scale:float=3.0, tight_culling:bo
         tile_span = max_tile - min_tile)
 
 
+  @ti.func
+  def gaussian_max_inner(alpha: ti.f32) -> ti.f32:
+      # a gaussian contributes where alpha * exp(-inner) >= alpha_threshold
+      # and within gaussian_scale standard deviations, negative if it never contributes
+      return ti.min(ti.static(0.5 * gaussian_scale ** 2), 
+                    ti.log(alpha / ti.static(alpha_threshold)))
+
+  @ti.func
+  def conic_inner(uv_conic: vec3, d: vec2) -> ti.f32:
+      a, b, c = uv_conic
+      return 0.5 * (d.x**2 * a + d.y**2 * c) + d.x * d.y * b
+
+  @ti.func
+  def box_min_inner(uv_conic: vec3, lower: vec2, upper: vec2) -> ti.f32:
+      # minimum of the quadratic form over a box (relative to the gaussian center)
+      # zero if the center is inside, otherwise the minimum is found on one of the edges
+      a, b, c = uv_conic
+      inner = 0.0
+
+      if (lower > 0).any() or (upper < 0).any():
+        xs = vec2(lower.x, upper.x)
+        ys = vec2(lower.y, upper.y)
+
+        inner = conic_inner(uv_conic, lower)
+        for i in ti.static(range(2)):
+          y = ti.math.clamp(-b * xs[i] / c, lower.y, upper.y)
+          x = ti.math.clamp(-b * ys[i] / a, lower.x, upper.x)
+
+          inner = ti.min(inner, 
+            conic_inner(uv_conic, vec2(xs[i], y)), 
+            conic_inner(uv_conic, vec2(x, ys[i])))
+
+      return inner
+
   @ti.func
   def cov_tile_ranges(
       uv: vec2,
       uv_cov: vec3,
       image_size: ti.math.ivec2,
+      max_inner: ti.f32
   ):
 
       # avoid zero radii, at least 1 pixel
-      radius = ti.max(radii_from_cov(uv_cov) * gaussian_scale, 1.0)  
+      scale = ti.sqrt(2 * ti.max(max_inner, 0.))
+      radius = ti.max(radii_from_cov(uv_cov) * scale, 1.0)  
 
       min_bound = ti.max(0.0, uv - radius)
       max_bound = uv + radius
@@ -92,6 +171,10 @@ def make_grid_query(tile_size:int=16, gaussian_scale:float=3.0, tight_culling:bo
       max_tile_bound = ti.cast(max_bound / tile_size, ti.i32) + 1
       max_tile_bound = ti.min(ti.max(max_tile_bound, min_tile_bound + 1),
                           max_tile)
+      
+      # cull gaussians which are too transparent to contribute anywhere
+      if max_inner < 0:
+        max_tile_bound = min_tile_bound
 
       return min_tile_bound, max_tile_bound
   
@@ -100,10 +183,10 @@ def make_grid_query(tile_size:int=16, gaussian_scale:float=3.0, tight_culling:bo
       gaussian: Gaussian2D.vec,
       image_size: ti.math.ivec2,
   ):
-      uv, uv_conic, _ = Gaussian2D.unpack(gaussian)
+      uv, uv_conic, alpha = Gaussian2D.unpack(gaussian)
       uv_cov = inverse_cov(uv_conic)
 
-      return cov_tile_ranges(uv, uv_cov, image_size)
+      return cov_tile_ranges(uv, uv_cov, image_size, gaussian_max_inner(alpha))
 
   @ti.func
   def separates_bbox(inv_basis: mat2, lower:vec2, upper:vec2) -> bool:
@@ -124,9 +207,11 @@ def make_grid_query(tile_size:int=16, gaussian_scale:float=3.0, tight_culling:bo
   
 
   return SimpleNamespace(
-    grid_query = obb_grid_query if tight_culling else range_grid_query,
+    grid_query = ellipse_grid_query if tight_culling else range_grid_query,
+    ellipse_grid_query = ellipse_grid_query,
     obb_grid_query = obb_grid_query,
     range_grid_query = range_grid_query,
     separates_bbox = separates_bbox,
+    box_min_inner = box_min_inner,
     gaussian_tile_bounds = gaussian_tile_bounds,
     cov_tile_ranges = cov_tile_ranges)
\ No newline at end of file
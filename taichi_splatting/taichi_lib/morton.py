@@ -0,0 +1,34 @@
+import taichi as ti
+
+
+@ti.func
+def interleave(x:ti.i32):
+    # spread the low 16 bits of x to the even bits
+    x = ( x | ( x << 8 ) ) & 0x00FF00FF
+    x = ( x | ( x << 4 ) ) & 0x0F0F0F0F
+    x = ( x | ( x << 2 ) ) & 0x33333333
+    x = ( x | ( x << 1 ) ) & 0x55555555
+    return x
+
+
+@ti.func
+def deinterleave(x:ti.i32):
+  x &= 0x55555555                   
+  x = (x ^ (x >>  1)) & 0x33333333 
+  x = (x ^ (x >>  2)) & 0x0f0f0f0f
+  x = (x ^ (x >>  4)) & 0x00ff00ff
+  x = (x ^ (x >>  8)) & 0x0000ffff
+  return x
+
+
+@ti.func
+def morton_tile(x:ti.i32, y:ti.i32):
+    order = interleave(x) | ( interleave(y) << 1 )
+    return order
+
+@ti.func
+def morton_tile_inv(order:ti.i32):
+  x = deinterleave(order)
+  y = deinterleave(order >> 1)
+  return x, y
+
@@ -0,0 +1,142 @@
+from functools import cache
+import math
+from tqdm import tqdm
+import torch
+import taichi as ti
+from taichi.math import ivec2
+
+from taichi_splatting.misc.projection2d import project_gaussians2d
+from taichi_splatting.taichi_lib.f32 import Gaussian2D
+from taichi_splatting.taichi_lib.grid_query import make_grid_query
+from taichi_splatting.tests.random_data import random_2d_gaussians
+
+
+ti.init(arch=ti.cpu, offline_cache=True, log_level=ti.INFO, debug=True)
+
+gaussian_scale = 3.0
+alpha_threshold = 1. / 255.
+
+
+@cache
+def tile_mask_kernel(tile_size:int):
+  query_ops = make_grid_query(
+    tile_size=tile_size,
+    gaussian_scale=gaussian_scale,
+    alpha_threshold=alpha_threshold,
+    tight_culling=True)
+
+  ellipse_grid_query = query_ops.ellipse_grid_query
+
+  @ti.kernel
+  def k(gaussians: ti.types.ndarray(Gaussian2D.vec, ndim=1), image_size: ivec2,
+        mask: ti.types.ndarray(ti.i32, ndim=3), # (N, tiles_high, tiles_wide)
+        counts: ti.types.ndarray(ti.i32, ndim=1)): # (N)
+
+    for idx, tile_y, tile_x in ti.ndrange(*mask.shape):
+      query = ellipse_grid_query(gaussians[idx], image_size)
+      tile_uv = ivec2(tile_x, tile_y) - query.min_tile
+
+      overlaps = 0
+      if (tile_uv >= 0).all() and (tile_uv < query.tile_span).all():
+        overlaps = ti.select(query.test_tile(tile_uv), 1, 0)
+      mask[idx, tile_y, tile_x] = overlaps
+
+    for idx in range(gaussians.shape[0]):
+      counts[idx] = ellipse_grid_query(gaussians[idx], image_size).count_tiles()
+
+  return k
+
+
+def tile_mask(gaussians:torch.Tensor, image_size, tile_size:int):
+  tiles_wide, tiles_high = [x // tile_size for x in image_size]
+  n = gaussians.shape[0]
+
+  mask = torch.empty((n, tiles_high, tiles_wide), dtype=torch.int32)
+  counts = torch.empty((n, ), dtype=torch.int32)
+  tile_mask_kernel(tile_size)(gaussians, ivec2(image_size), mask, counts)
+  return mask.bool(), counts
+
+
+def sampled_tile_mask(gaussians:torch.Tensor, image_size, tile_size:int, eps:float=1e-3):
+  """ tiles containing a pixel center where the gaussian contributes,
+      alpha * exp(-inner) >= alpha_threshold (within gaussian_scale standard deviations) """
+  gaussians = gaussians.to(torch.float64)
+  uv, conic, alpha = gaussians[:, 0:2], gaussians[:, 2:5], gaussians[:, 5]
+
+  w, h = image_size
+  y, x = torch.meshgrid(torch.arange(h, dtype=torch.float64) + 0.5,
+                        torch.arange(w, dtype=torch.float64) + 0.5, indexing='ij')
+
+  dx = x.unsqueeze(0) - uv[:, 0].view(-1, 1, 1)
+  dy = y.unsqueeze(0) - uv[:, 1].view(-1, 1, 1)
+  a, b, c = [conic[:, i].view(-1, 1, 1) for i in range(3)]
+
+  inner = 0.5 * (dx**2 * a + dy**2 * c) + dx * dy * b
+  max_inner = torch.clamp_max(torch.log(alpha / alpha_threshold), 0.5 * gaussian_scale**2)
+
+  # strictly inside, so float32 rounding in the kernel cannot flip a pixel
+  contributes = inner <= (max_inner.view(-1, 1, 1) - eps)
+
+  tiles_wide, tiles_high = w // tile_size, h // tile_size
+  pixel_tiles = contributes.view(-1, tiles_high, tile_size, tiles_wide, tile_size)
+  return pixel_tiles.any(dim=4).any(dim=2)
+
+
+def random_gaussians(seed:int, image_size, alpha_range=(0.1, 0.9)):
+  torch.manual_seed(seed)
+  n = torch.randint(1, 50, (1,)).item()
+
+  gaussians = random_2d_gaussians(n, image_size, alpha_range=alpha_range)
+  # stretch one axis for strongly anisotropic gaussians
+  gaussians.log_scaling[:, 0] += torch.rand(n) * math.log(8.0)
+
+  with torch.no_grad():
+    return project_gaussians2d(gaussians)
+
+
+def test_grid_query_sampled(iters=50):
+  for tile_size in [8, 16]:
+    image_size = (tile_size * 9, tile_size * 5)
+
+    for i in tqdm(range(iters), desc=f"grid_query tile_size={tile_size}"):
+      gaussians = random_gaussians(i, image_size)
+
+      mask, counts = tile_mask(gaussians, image_size, tile_size)
+      sampled = sampled_tile_mask(gaussians, image_size, tile_size)
+
+      # every tile with a contributing pixel must pass test_tile (conservative)
+      missed = sampled & ~mask
+      assert not missed.any(), f"test_tile missed {missed.sum()} tiles with contributing pixels"
+
+      assert torch.equal(counts, mask.sum(dim=(1, 2)).to(torch.int32))
+
+
+def test_grid_query_threshold(iters=50):
+  tile_size = 16
+  image_size = (tile_size * 9, tile_size * 5)
+
+  for i in tqdm(range(iters), desc="grid_query_threshold"):
+    gaussians = random_gaussians(i, image_size)
+    n = gaussians.shape[0]
+
+    # alpha just below the threshold (max_inner < 0) never contributes - must be culled
+    gaussians[:, 5] = alpha_threshold * (1 - torch.rand(n) * 0.1 - 1e-3)
+    mask, counts = tile_mask(gaussians, image_size, tile_size)
+
+    assert not mask.any() and (counts == 0).all(), "gaussians below alpha_threshold should be culled"
+
+    # alpha just above the threshold contributes (only) near the center
+    gaussians[:, 5] = alpha_threshold * (1 + torch.rand(n) * 0.1 + 1e-3)
+    mask, counts = tile_mask(gaussians, image_size, tile_size)
+    sampled = sampled_tile_mask(gaussians, image_size, tile_size)
+
+    center_tile = (gaussians[:, 0:2] / tile_size).to(torch.int64)
+    assert mask[torch.arange(n), center_tile[:, 1], center_tile[:, 0]].all(), \
+      "tile containing the center of a gaussian above alpha_threshold should overlap"
+
+    assert not (sampled & ~mask).any()
+
+
+if __name__ == '__main__':
+  test_grid_query_sampled()
+  test_grid_query_threshold()
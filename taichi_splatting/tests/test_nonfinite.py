@@ -0,0 +1,70 @@
+import pytest
+import torch
+import taichi as ti
+
+from taichi_splatting.misc.nonfinite import count_nonfinite, check_counts
+
+
+ti.init(arch=ti.cpu, offline_cache=True, log_level=ti.INFO, debug=True)
+
+
+def with_nonfinite(n:int, num_nan:int, num_inf:int, dtype=torch.float32):
+  t = torch.randn(n, dtype=dtype)
+  idx = torch.randperm(n)
+
+  t[idx[:num_nan]] = float('nan')
+  t[idx[num_nan:num_nan + num_inf]] = float('inf') * torch.sign(torch.randn(num_inf, dtype=dtype))
+  return t
+
+
+def test_count_nonfinite():
+  torch.manual_seed(0)
+  tensors = dict(
+    a = with_nonfinite(1000, num_nan=3, num_inf=5),
+    b = with_nonfinite(17, num_nan=0, num_inf=1).view(-1, 1),
+    c = with_nonfinite(100, num_nan=2, num_inf=0, dtype=torch.float64),
+    d = torch.randn(10),
+    e = torch.arange(10)  # not floating point, ignored
+  )
+  expected = {k:(~torch.isfinite(v)).sum().item()
+              for k, v in tensors.items() if v.is_floating_point()}
+  copies = {k:v.clone() for k, v in tensors.items()}
+
+  counts = count_nonfinite(tensors, 'x')
+  assert {k:v.item() for k, v in counts.items()} == {f'x.{k}':n for k, n in expected.items()}
+
+  # counting does not modify the tensors
+  for k, v in tensors.items():
+    assert torch.equal(v.nan_to_num(), copies[k].nan_to_num())
+
+  # counts accumulate over calls
+  count_nonfinite(tensors, 'x', counts)
+  assert {k:v.item() for k, v in counts.items()} == {f'x.{k}':2 * n for k, n in expected.items()}
+
+  with pytest.raises(ValueError):
+    check_counts(counts)
+  check_counts(counts, warn=True)
+
+
+def test_zero_nonfinite():
+  torch.manual_seed(0)
+  t = with_nonfinite(1000, num_nan=4, num_inf=4).requires_grad_(True)
+  t.grad = with_nonfinite(1000, num_nan=1, num_inf=2)
+
+  expected = [torch.where(torch.isfinite(x), x, torch.zeros_like(x)) for x in [t.detach(), t.grad]]
+  counts = count_nonfinite(t, 't', zero_nonfinite=True)
+
+  assert counts['t'].item() == 8 and counts['t.grad'].item() == 3
+  assert torch.equal(t.detach(), expected[0]) and torch.equal(t.grad, expected[1])
+
+  # all zeroed - nothing found
+  counts = count_nonfinite(t, 't')
+  assert counts['t'].item() == 0 and counts['t.grad'].item() == 0
+  check_counts(counts)
+
+
+def test_nonfinite_contiguous():
+  t = with_nonfinite(100, num_nan=2, num_inf=2).view(10, 10)
+
+  with pytest.raises(AssertionError):
+    count_nonfinite(t.t(), 't')
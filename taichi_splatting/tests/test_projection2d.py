@@ -0,0 +1,46 @@
+from typing import Callable
+from tqdm import tqdm
+
+from taichi_splatting.tests.util import compare_with_grad
+from taichi_splatting.tests.random_data import random_2d_gaussians
+
+import taichi_splatting.misc.projection2d as ti_proj
+import taichi_splatting.torch_ops.projection2d as torch_proj
+
+import torch
+import taichi as ti
+
+
+ti.init(arch=ti.cpu, offline_cache=True, log_level=ti.INFO, debug=True)
+
+
+def random_inputs(max_points=1000, dtype=torch.float64) -> Callable:
+  def f(seed:int = 0):
+    torch.manual_seed(seed)
+    n = torch.randint(size=(1,), low=1, high=max_points).item()
+
+    gaussians = random_2d_gaussians(n, image_size=(640, 480))
+    return tuple(x.to(dtype=dtype).requires_grad_(True) for x in
+      [gaussians.position, gaussians.log_scaling, gaussians.rotation, gaussians.alpha_logit])
+  return f
+
+
+def test_projection2d(iters = 100):
+  compare_with_grad("projection2d",
+    ["position", "log_scaling", "rotation", "alpha_logit"], "points",
+    ti_proj.apply, torch_proj.apply, random_inputs(), iters=iters)
+
+
+def test_projection2d_grad(iters = 100):
+  gen_inputs = random_inputs(max_points=10)
+
+  for i in tqdm(range(iters), desc="projection2d_gradcheck"):
+    inputs = gen_inputs(i)
+    torch.autograd.gradcheck(ti_proj.apply, inputs)
+
+
+if __name__ == '__main__':
+  torch.set_printoptions(precision=8, sci_mode=False)
+
+  test_projection2d()
+  test_projection2d_grad()
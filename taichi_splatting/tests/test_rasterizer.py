@@ -1,9 +1,12 @@
 
 
 import argparse
+from dataclasses import replace
 
 from tqdm import tqdm
 from taichi_splatting.data_types import RasterConfig
+from taichi_splatting.mapper.tile_mapper import map_to_tiles, pad_to_tile
+from taichi_splatting.misc.encode_depth import encode_depth32
 from taichi_splatting.misc.renderer2d import  project_gaussians2d
 from taichi_splatting.rasterizer.function import rasterize_with_tiles
 from taichi_splatting.tests.random_data import random_2d_gaussians
@@ -77,6 +80,122 @@ def test_rasterizer_gradcheck(show = False, iters = 100, device=torch.device('cu
 
 
 
+# multiple tiles, image sizes which are not a multiple of the tile size (padded then cropped),
+# pixel_stride > 1 and macro tiles (mapped at a multiple of tile_size)
+tiled_configs = [
+  ((20, 12), RasterConfig(tile_size=8, pixel_stride=(1, 1))),
+  ((40, 20), RasterConfig(tile_size=16, pixel_stride=(2, 2))),
+  ((20, 12), RasterConfig(tile_size=8, pixel_stride=(1, 1), macro_tile_size=16)),
+  ((40, 20), RasterConfig(tile_size=16, pixel_stride=(2, 2), macro_tile_size=32)),
+]
+
+
+def make_tiled_inputs(seed, image_size, config, dtype=torch.float64, device=torch.device('cuda:0')):
+    torch.random.manual_seed(seed)
+
+    n = torch.randint(1, 50, (1,)).item()
+    channels = torch.randint(1, 4, (1,)).item()
+
+    gaussians = random_2d_gaussians(n, image_size, num_channels=channels, scale_factor=1.0, alpha_range=(0.2, 0.8)).to(device=device)  
+    gaussians2d = project_gaussians2d(gaussians)
+
+    # tile mapping is fixed (not differentiable)
+    overlap_to_point, tile_ranges = map_to_tiles(gaussians2d.detach(), encode_depth32(gaussians.depths), 
+                                                 image_size=image_size, config=config)
+    tile_ranges = tile_ranges.view(-1, 2)
+
+    gaussians2d, colors = [x.detach().to(dtype=dtype) for x in [gaussians2d, gaussians.feature]]
+
+    def rasterize(uv, conic, alpha, colors):
+      packed = torch.cat([uv, conic, alpha], dim=-1)
+      return rasterize_with_tiles(packed, colors, overlap_to_point=overlap_to_point, tile_overlap_ranges=tile_ranges, 
+                     image_size=image_size, config=config).image
+    
+    inputs = (gaussians2d[:, 0:2].requires_grad_(True), 
+            gaussians2d[:, 2:5].requires_grad_(True), 
+            gaussians2d[:, 5:6].requires_grad_(True), 
+            colors.requires_grad_(True))
+    
+    return inputs, rasterize, (overlap_to_point, tile_ranges)
+
+
+def rasterize_torch(gaussians2d, features, overlap_to_point, tile_ranges, image_size, config):
+  """ reference rasterizer - composites the points of each (mapped) tile front to back for each pixel """
+  map_tile_size = config.map_tile_size
+  padded_w, padded_h = pad_to_tile(image_size, map_tile_size)
+  tiles_wide = padded_w // map_tile_size
+
+  image = features.new_zeros((padded_h, padded_w, features.shape[1]))
+  image_weight = features.new_zeros((padded_h, padded_w))
+
+  for tile_id, (start, end) in enumerate(tile_ranges.tolist()):
+    if start == end:
+      continue
+
+    tile_y, tile_x = divmod(tile_id, tiles_wide)
+    ys, xs = [torch.arange(t * map_tile_size, (t + 1) * map_tile_size, device=features.device) 
+              for t in (tile_y, tile_x)]
+    y, x = torch.meshgrid(ys.to(features.dtype) + 0.5, xs.to(features.dtype) + 0.5, indexing='ij')
+
+    point_idx = overlap_to_point[start:end].long()
+    uv, conic, point_alpha = gaussians2d[point_idx, 0:2], gaussians2d[point_idx, 2:5], gaussians2d[point_idx, 5]
+
+    # (pixels, points)
+    dx = x.reshape(-1, 1) - uv[:, 0]
+    dy = y.reshape(-1, 1) - uv[:, 1]
+    inner = 0.5 * (dx**2 * conic[:, 0] + dy**2 * conic[:, 2]) + dx * dy * conic[:, 1]
+
+    alpha = point_alpha * torch.exp(-inner)
+    alpha = torch.where(alpha >= config.alpha_threshold, 
+                        torch.clamp_max(alpha, config.clamp_max_alpha), torch.zeros_like(alpha))
+
+    # stop before the accumulated opacity exceeds saturate_threshold (T is non increasing)
+    alpha = alpha * (torch.cumprod(1 - alpha, dim=1) >= 1 - config.saturate_threshold)
+
+    T = torch.cumprod(1 - alpha, dim=1)
+    T_before = torch.cat([torch.ones_like(T[:, :1]), T[:, :-1]], dim=1)
+
+    tile_image = (alpha * T_before) @ features[point_idx]
+    image[ys[0]:ys[-1] + 1, xs[0]:xs[-1] + 1] = tile_image.view(map_tile_size, map_tile_size, -1)
+    image_weight[ys[0]:ys[-1] + 1, xs[0]:xs[-1] + 1] = (1 - T[:, -1]).view(map_tile_size, map_tile_size)
+
+  w, h = image_size
+  return image[:h, :w], image_weight[:h, :w]
+
+
+def test_rasterizer_tiled_gradcheck(iters = 20, device=torch.device('cuda:0')):
+  for image_size, config in tiled_configs:
+    for seed in tqdm(range(iters), desc=f"rasterizer_gradcheck {image_size} {config.tile_size}/{config.map_tile_size} {config.pixel_stride}"):
+      inputs, render, _ = make_tiled_inputs(seed, image_size, config, device=device)
+      torch.autograd.gradcheck(render, inputs, eps=1e-6, check_grad_dtypes=True, check_undefined_grad=True)
+
+
+def test_rasterizer_reference(iters = 20, device=torch.device('cuda:0')):
+  fp16_configs = [(image_size, replace(config, use_fp16_features=True, use_fp16_conic=True)) 
+                  for image_size, config in tiled_configs]
+
+  cases = ([(image_size, config, torch.float64, 1e-8) for image_size, config in tiled_configs] + 
+           [(image_size, config, torch.float32, 2e-2) for image_size, config in fp16_configs])
+
+  for image_size, config, dtype, atol in cases:
+    for seed in tqdm(range(iters), desc=f"rasterizer_reference {image_size} {config.tile_size}/{config.map_tile_size} {dtype}"):
+      inputs, _, (overlap_to_point, tile_ranges) = make_tiled_inputs(seed, image_size, config, dtype=dtype, device=device)
+      uv, conic, alpha, colors = [x.detach() for x in inputs]
+      packed = torch.cat([uv, conic, alpha], dim=-1)
+
+      raster = rasterize_with_tiles(packed, colors, overlap_to_point=overlap_to_point, tile_overlap_ranges=tile_ranges, 
+                     image_size=image_size, config=config)
+      image, image_weight = rasterize_torch(packed, colors, overlap_to_point, tile_ranges, image_size, config)
+
+      w, h = image_size
+      assert raster.image.shape == (h, w, colors.shape[1]) and raster.image_weight.shape == (h, w)
+
+      assert torch.allclose(raster.image, image, atol=atol), \
+        f"image mismatch (seed {seed}), max error {(raster.image - image).abs().max()}"
+      assert torch.allclose(raster.image_weight, image_weight, atol=atol), \
+        f"image_weight mismatch (seed {seed}), max error {(raster.image_weight - image_weight).abs().max()}"
+
+
 def main(show=False, debug=False):
   torch.set_printoptions(precision=10, sci_mode=False)
   
@@ -84,6 +203,8 @@ def main(show=False, debug=False):
 
   ti.init(arch=ti.cuda, default_fp=ti.f64, debug=debug)
   test_rasterizer_gradcheck(show)
+  test_rasterizer_tiled_gradcheck()
+  test_rasterizer_reference()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,193 @@
+from functools import cache
+from tqdm import tqdm
+import torch
+import taichi as ti
+from taichi.math import ivec2
+
+from taichi_splatting.data_types import RasterConfig
+from taichi_splatting.mapper.tile_mapper import find_ranges_kernel, map_to_tiles, pad_to_tile, sort_bits, tile_mapper
+from taichi_splatting.misc.encode_depth import encode_depth16, encode_depth32
+from taichi_splatting.misc.projection2d import project_gaussians2d
+from taichi_splatting.taichi_lib.f32 import Gaussian2D
+from taichi_splatting.taichi_lib.grid_query import make_grid_query
+from taichi_splatting.tests.random_data import random_2d_gaussians
+
+
+ti.init(arch=ti.cuda, offline_cache=True, log_level=ti.INFO, debug=True)
+device = torch.device('cuda')
+
+
+def to_int32(keys:torch.Tensor) -> torch.Tensor:
+  # unsigned 32 bit keys (in int64) to the same bit pattern in int32
+  return torch.where(keys >= 2**31, keys - 2**32, keys).to(torch.int32)
+
+
+def find_ranges_torch(tile_ids:torch.Tensor, num_tiles:int) -> torch.Tensor:
+  counts = torch.bincount(tile_ids, minlength=num_tiles)
+  end = torch.cumsum(counts, dim=0)
+  ranges = torch.stack([end - counts, end], dim=1)
+
+  # tiles with no overlaps have an empty (0, 0) range
+  ranges[counts == 0] = 0
+  return ranges.to(torch.int32)
+
+
+def random_sorted_keys(num_tiles:int, seed:int):
+  torch.manual_seed(seed)
+  tile_shift = 32 - max(sort_bits(num_tiles), 1)
+
+  # sparse subset of the tiles (often missing the first and last tiles)
+  num_occupied = torch.randint(1, num_tiles + 1, (1,)).item()
+  occupied = torch.randperm(num_tiles)[:num_occupied]
+
+  n = torch.randint(1, 1000, (1,)).item()
+  tile_ids = occupied[torch.randint(0, num_occupied, (n,))]
+  depth = torch.randint(0, 2**tile_shift, (n,))
+
+  keys, _ = torch.sort((tile_ids << tile_shift) | depth)
+  return to_int32(keys), tile_ids, tile_shift
+
+
+def test_find_ranges(iters=100):
+  # non power of two tile grids (tiles_high, tiles_wide)
+  tile_shapes = [(1, 1), (1, 13), (5, 7), (17, 30), (68, 120)]
+
+  for i in tqdm(range(iters), desc="find_ranges"):
+    tile_shape = tile_shapes[i % len(tile_shapes)]
+    num_tiles = tile_shape[0] * tile_shape[1]
+
+    keys, tile_ids, tile_shift = random_sorted_keys(num_tiles, seed=i)
+    expected = find_ranges_torch(tile_ids, num_tiles)
+
+    # filled with garbage - every tile must be written
+    tile_ranges = torch.full((*tile_shape, 2), -1, dtype=torch.int32, device=device)
+    find_ranges_kernel(keys.to(device), tile_ranges.view(-1, 2), tile_shift)
+
+    assert torch.equal(tile_ranges.view(-1, 2).cpu(), expected), \
+      f"find_ranges mismatch for tile shape {tile_shape}"
+
+
+
+@cache
+def overlap_mask_kernel(config:RasterConfig):
+  grid_query = make_grid_query(
+    tile_size=config.map_tile_size, 
+    gaussian_scale=config.gaussian_scale, 
+    alpha_threshold=config.alpha_threshold,
+    tight_culling=config.tight_culling).grid_query
+
+  @ti.kernel
+  def k(gaussians: ti.types.ndarray(Gaussian2D.vec, ndim=1), image_size: ivec2,
+        mask: ti.types.ndarray(ti.i32, ndim=3)): # (N, tiles_high, tiles_wide)
+    
+    # brute force - test every tile of the image for every gaussian
+    for idx, tile_y, tile_x in ti.ndrange(*mask.shape):
+      query = grid_query(gaussians[idx], image_size)
+      tile_uv = ivec2(tile_x, tile_y) - query.min_tile
+
+      overlaps = 0
+      if (tile_uv >= 0).all() and (tile_uv < query.tile_span).all():
+        overlaps = ti.select(query.test_tile(tile_uv), 1, 0)
+      mask[idx, tile_y, tile_x] = overlaps
+
+  return k
+
+
+def overlap_mask(gaussians:torch.Tensor, image_size, config:RasterConfig) -> torch.Tensor:
+  image_size = pad_to_tile(image_size, config.map_tile_size)
+  tiles_wide, tiles_high = [x // config.map_tile_size for x in image_size]
+
+  mask = torch.empty((gaussians.shape[0], tiles_high, tiles_wide), dtype=torch.int32, device=gaussians.device)
+  overlap_mask_kernel(config)(gaussians, ivec2(image_size), mask)
+  return mask.view(gaussians.shape[0], -1).bool()
+
+
+def depth_key(encoded_depth:torch.Tensor, tile_shift:int) -> torch.Tensor:
+  # the (most significant) bits of depth kept in the sort key
+  if encoded_depth.dtype == torch.int32:
+    return encoded_depth.to(torch.int64) >> (31 - tile_shift)
+  else:
+    return (encoded_depth.to(torch.int64) + 32767) >> (16 - tile_shift)
+
+
+def map_to_tiles_torch(gaussians:torch.Tensor, encoded_depth:torch.Tensor, image_size, config:RasterConfig):
+  mask = overlap_mask(gaussians, image_size, config)
+  num_points, num_tiles = mask.shape
+
+  depth_bits = 31 if encoded_depth.dtype == torch.int32 else 16
+  tile_shift = min(depth_bits, 32 - max(sort_bits(num_tiles), 1))
+
+  point_idx, tile_id = torch.nonzero(mask, as_tuple=True)
+  key = (tile_id << tile_shift) | depth_key(encoded_depth, tile_shift)[point_idx]
+
+  # sorted by tile, depth, then point index (ties)
+  order = torch.argsort(key * num_points + point_idx)
+  return point_idx[order].to(torch.int32), find_ranges_torch(tile_id, num_tiles)
+
+
+def random_mapper_inputs(seed:int, image_size, depth_type:torch.dtype):
+  torch.manual_seed(seed)
+  n = torch.randint(1, 2000, (1,)).item()
+  gaussians = random_2d_gaussians(n, image_size).to(device)
+
+  if seed % 2 == 0:
+    # few distinct depths, so many points tie in depth
+    gaussians.depths = torch.randint(1, 4, (n, 1), device=device).to(torch.float32)
+
+  if depth_type == torch.int32:
+    encoded_depth = encode_depth32(gaussians.depths)
+  else:
+    encoded_depth = encode_depth16(gaussians.depths, (0.1, 100.0))
+
+  return project_gaussians2d(gaussians), encoded_depth
+
+
+image_sizes = [(16, 16), (100, 60), (250, 130), (333, 17)]
+
+
+def test_overlap_offsets(iters=20):
+  config = RasterConfig()
+  mapper = tile_mapper(config, depth_type=torch.int32)
+
+  for i in tqdm(range(iters), desc="overlap_offsets"):
+    image_size = image_sizes[i % len(image_sizes)]
+    gaussians, _ = random_mapper_inputs(i, image_size, torch.int32)
+
+    overlap_offsets, block_offsets, total_overlap = mapper.generate_tile_overlaps(
+      gaussians, pad_to_tile(image_size, config.map_tile_size))
+    
+    idx = torch.arange(gaussians.shape[0], device=device)
+    offsets = overlap_offsets + block_offsets[idx // mapper.overlap_block_dim]
+
+    # offsets are the exclusive cumsum of the counts, so the ranges [offset, offset + count) 
+    # are a disjoint cover of [0, total_overlap)
+    counts = overlap_mask(gaussians, image_size, config).sum(dim=1)
+    expected = torch.cumsum(counts, dim=0) - counts
+
+    assert torch.equal(offsets.to(torch.int64), expected), f"overlap offsets mismatch for {image_size}"
+    assert total_overlap.item() == counts.sum().item()
+
+
+def test_map_to_tiles(iters=40):
+  configs = [RasterConfig(tile_size=8), RasterConfig(tile_size=16), 
+             RasterConfig(tile_size=8, macro_tile_size=16)]
+
+  for depth_type in [torch.int32, torch.int16]:
+    for config in configs:
+      for i in tqdm(range(iters), desc=f"map_to_tiles {depth_type} map_tile_size={config.map_tile_size}"):
+        image_size = image_sizes[i % len(image_sizes)]
+        gaussians, encoded_depth = random_mapper_inputs(i, image_size, depth_type)
+
+        overlap_to_point, tile_ranges = map_to_tiles(gaussians, encoded_depth, image_size, config)
+        expected_to_point, expected_ranges = map_to_tiles_torch(gaussians, encoded_depth, image_size, config)
+
+        assert torch.equal(tile_ranges.view(-1, 2).cpu(), expected_ranges.cpu()), \
+          f"tile_ranges mismatch for {image_size}"
+        assert torch.equal(overlap_to_point, expected_to_point), \
+          f"overlap_to_point mismatch for {image_size}"
+
+
+if __name__ == '__main__':
+  test_find_ranges()
+  test_overlap_offsets()
+  test_map_to_tiles()
@@ -0,0 +1,28 @@
+import torch
+
+from taichi_splatting.torch_ops.projection import cov_to_conic
+
+
+def point_covariance(log_scaling:torch.Tensor, rotation:torch.Tensor) -> torch.Tensor:
+  scale = torch.exp(log_scaling)
+
+  v1 = rotation / torch.norm(rotation, dim=1, keepdim=True)
+  v2 = torch.stack([-v1[..., 1], v1[..., 0]], dim=-1)
+
+  basis = torch.stack([v1, v2], dim=2) * scale.unsqueeze(-1)
+  return torch.bmm(basis.transpose(1, 2), basis)
+
+
+def apply(position:torch.Tensor, log_scaling:torch.Tensor, 
+          rotation:torch.Tensor, alpha_logit:torch.Tensor) -> torch.Tensor:
+  
+  alpha = torch.sigmoid(alpha_logit.reshape(-1))
+  # closed form 2x2 inverse (torch.inverse is a batched LU factorization)
+  conic = cov_to_conic(point_covariance(log_scaling, rotation))
+  return torch.cat([position, conic, alpha.unsqueeze(1)], dim=-1)  
+
+
+def project_gaussians2d(points) -> torch.Tensor:
+  """ Torch reference implementation of misc.projection2d.project_gaussians2d """
+  return apply(points.position, points.log_scaling, 
+               points.rotation, points.alpha_logit)